@@ -0,0 +1,3 @@
+# Offline benchmarks — run from backend/ with `python -m benchmarks.run`.
+# OpenAI, Pinecone, Redis, Postgres and S3 are replaced by local stand-ins (see fakes.py),
+# so results measure this code rather than the network and can be compared between commits.
@@ -0,0 +1,83 @@
+import os
+import random
+
+# Small fixed vocabulary so queries share words with the documents and retrieval has something to find
+VOCABULARY = (
+    "account invoice payment refund policy contract renewal customer support ticket "
+    "deployment server database backup restore latency region cluster network storage "
+    "employee onboarding benefits holiday salary review manager training security password "
+    "incident report outage escalation priority release feature roadmap budget forecast "
+    "quarter revenue margin supplier shipment warehouse inventory order delivery compliance"
+).split()
+
+
+def make_pdf(pages):
+    # Minimal single-font PDF, one text page per string — no PDF library needed to write it
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        ),
+    ]
+    font = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        lines = [
+            line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            for line in text.split("\n")
+        ]
+        stream = "BT /F1 10 Tf 12 TL 40 780 Td " + " ".join(f"({l}) Tj T*" for l in lines) + " ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def synthetic_pages(seed, pages=10, lines_per_page=40, words_per_line=12):
+    # Deterministic text for one document — the same seed always gives the same pages
+    rng = random.Random(seed)
+    return [
+        "\n".join(
+            " ".join(rng.choice(VOCABULARY) for _ in range(words_per_line)) + "."
+            for _ in range(lines_per_page)
+        )
+        for _ in range(pages)
+    ]
+
+
+def write_corpus(directory, documents=10, pages=10, seed=0):
+    # Write documents synthetic PDFs into directory and return their paths
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"doc_{seed}_{i}.pdf")
+        with open(path, "wb") as file:
+            file.write(make_pdf(synthetic_pages(f"{seed}:{i}", pages=pages)))
+        paths.append(path)
+    return paths
+
+
+def synthetic_queries(count, distinct=None, seed=0, words=6):
+    # count questions drawn from `distinct` different ones — repeats exercise the answer caches
+    rng = random.Random(seed)
+    pool = [
+        "What does the policy say about "
+        + " ".join(rng.choice(VOCABULARY) for _ in range(words))
+        + "?"
+        for _ in range(distinct or count)
+    ]
+    queries = [pool[i % len(pool)] for i in range(count)]
+    rng.shuffle(queries)
+    return queries
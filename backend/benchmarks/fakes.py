@@ -0,0 +1,344 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from types import SimpleNamespace
+import httpx
+import numpy as np
+from local_index import LocalIndex
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+EMBEDDING_DIMENSION = 1536
+
+
+def fake_embedding(text, dimension=EMBEDDING_DIMENSION):
+    # Hashed bag of words, normalised — deterministic, and texts sharing words land close together,
+    # so retrieval and the semantic cache behave roughly like they do with real embeddings
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in text.lower().split():
+        digest = hashlib.md5(word.strip(".,?!").encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % dimension
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _fake_answer(messages):
+    prompt = messages[-1]["content"]
+    question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+    return f"Based on the provided documents, the answer to '{question}' is in the sources below."
+
+
+class FakeOpenAI:
+    # Same surface as the parts of openai.OpenAI this repo calls. Latencies are seconds per request,
+    # plus embed_item_latency for every input in an embeddings batch.
+    def __init__(self, embed_latency=0.0, embed_item_latency=0.0, chat_latency=0.0, dimension=EMBEDDING_DIMENSION):
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.chat_latency = chat_latency
+        self.dimension = dimension
+        self.calls = {"embeddings": 0, "embedded_texts": 0, "chat": 0}
+        self.embeddings = SimpleNamespace(create=self._create_embeddings)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    def _embed(self, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls["embeddings"] += 1
+        self.calls["embedded_texts"] += len(texts)
+        data = [SimpleNamespace(embedding=fake_embedding(t, self.dimension)) for t in texts]
+        return SimpleNamespace(data=data), self.embed_latency + self.embed_item_latency * len(texts)
+
+    def _create_embeddings(self, model, input, **kwargs):
+        response, latency = self._embed(input)
+        time.sleep(latency)
+        return response
+
+    def _create_completion(self, model, messages, stream=False, **kwargs):
+        self.calls["chat"] += 1
+        time.sleep(self.chat_latency)
+        return _completion(_fake_answer(messages))
+
+
+class AsyncFakeOpenAI(FakeOpenAI):
+    # openai.AsyncOpenAI counterpart — sleeps with asyncio so concurrent requests overlap
+    async def _create_embeddings(self, model, input, **kwargs):
+        response, latency = self._embed(input)
+        await asyncio.sleep(latency)
+        return response
+
+    async def _create_completion(self, model, messages, stream=False, **kwargs):
+        self.calls["chat"] += 1
+        answer = _fake_answer(messages)
+        if stream:
+            return self._stream(answer)
+        await asyncio.sleep(self.chat_latency)
+        return _completion(answer)
+
+    async def _stream(self, answer):
+        # Spread chat_latency over the tokens, like a model generating them one by one
+        tokens = [word + " " for word in answer.split()]
+        for token in tokens:
+            await asyncio.sleep(self.chat_latency / len(tokens))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+
+def _completion(answer):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+
+class InMemoryIndex(LocalIndex):
+    # The local vector backend, never persisted, with a simulated round trip on upsert and query
+    def __init__(self, latency=0.0, dimension=EMBEDDING_DIMENSION, hnsw=False):
+        super().__init__(dimension=dimension, path=None, hnsw=hnsw)
+        self.latency = latency
+
+    def upsert(self, vectors):
+        time.sleep(self.latency)
+        return super().upsert(vectors)
+
+    def query(self, vector, top_k=10, include_metadata=False, **kwargs):
+        time.sleep(self.latency)
+        return super().query(vector, top_k=top_k, include_metadata=include_metadata)
+
+
+def pinecone_transport(index, latency=0.0):
+    # Serves the REST /query call made by pinecone_handler.asearch_similar_chunks from the in-memory index
+    async def handle(request):
+        await asyncio.sleep(latency)
+        body = json.loads(request.content)
+        results = index.query(
+            vector=body["vector"], top_k=body["topK"], include_metadata=body.get("includeMetadata")
+        )
+        return httpx.Response(200, json=results)
+
+    return httpx.MockTransport(handle)
+
+
+class SQLiteJobStore:
+    # Stand-in for the db_handler functions. Jobs are stored as JSON so any column
+    # update_job is given works without mirroring the Postgres schema.
+    def __init__(self, path=":memory:", latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+
+    def create_jobs_table(self):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs "
+                "(job_id TEXT PRIMARY KEY, batch_id TEXT, seq INTEGER, data TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch_id ON jobs (batch_id)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents (content_hash TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+
+    def _execute(self, sql, params=(), many=False):
+        time.sleep(self.latency)
+        with self.lock, self.conn:
+            if many:
+                self.conn.executemany(sql, params)
+                return []
+            return self.conn.execute(sql, params).fetchall()
+
+    def create_job(self, job_id, filename, status="pending"):
+        self.create_jobs([(job_id, filename)], status=status)
+
+    def create_jobs(self, jobs, status="pending", batch_id=None):
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (job_id, batch_id, seq, data) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    job_id,
+                    batch_id,
+                    i,
+                    json.dumps(
+                        {
+                            "job_id": job_id,
+                            "filename": filename,
+                            "status": status,
+                            "batch_id": batch_id,
+                            "created_at": now,
+                        }
+                    ),
+                )
+                for i, (job_id, filename) in enumerate(jobs)
+            ],
+            many=True,
+        )
+
+    def update_job(self, job_id, **kwargs):
+        rows = self._execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,))
+        if rows:
+            data = {**json.loads(rows[0][0]), **kwargs}
+            self._execute(
+                "UPDATE jobs SET data = ? WHERE job_id = ?",
+                (json.dumps(data, default=str), job_id),
+            )
+
+    def get_job(self, job_id):
+        rows = self._execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_jobs(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return []
+        placeholders = ",".join("?" * len(job_ids))
+        rows = self._execute(f"SELECT data FROM jobs WHERE job_id IN ({placeholders})", job_ids)
+        return [json.loads(row[0]) for row in rows]
+
+    def get_batch_jobs(self, batch_id):
+        rows = self._execute("SELECT data FROM jobs WHERE batch_id = ? ORDER BY seq", (batch_id,))
+        return [json.loads(row[0]) for row in rows]
+
+    def get_document_by_hash(self, content_hash):
+        rows = self._execute("SELECT data FROM documents WHERE content_hash = ?", (content_hash,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_document_by_filename(self, filename):
+        documents = [json.loads(row[0]) for row in self._execute("SELECT data FROM documents")]
+        documents = [d for d in documents if d["filename"] == filename]
+        return max(documents, key=lambda d: d["created_at"], default=None)
+
+    def create_document(self, content_hash, filename, chunks_created):
+        data = {
+            "content_hash": content_hash,
+            "filename": filename,
+            "aliases": [],
+            "chunks_created": chunks_created,
+            "created_at": time.time(),
+        }
+        self._execute(
+            "INSERT OR IGNORE INTO documents (content_hash, data) VALUES (?, ?)",
+            (content_hash, json.dumps(data)),
+        )
+
+    def add_document_alias(self, content_hash, filename):
+        document = self.get_document_by_hash(content_hash)
+        if document and filename != document["filename"] and filename not in document["aliases"]:
+            document["aliases"].append(filename)
+            self._execute(
+                "UPDATE documents SET data = ? WHERE content_hash = ?",
+                (json.dumps(document), content_hash),
+            )
+
+    def rename_document(self, content_hash, filename):
+        document = self.get_document_by_hash(content_hash)
+        if document:
+            document["filename"] = filename
+            document["aliases"] = [a for a in document["aliases"] if a != filename]
+            self._execute(
+                "UPDATE documents SET data = ? WHERE content_hash = ?",
+                (json.dumps(document), content_hash),
+            )
+
+    def retire_documents_for_filename(self, filename):
+        for content_hash, data in self._execute("SELECT content_hash, data FROM documents"):
+            document = json.loads(data)
+            if document["filename"] == filename:
+                self._execute("DELETE FROM documents WHERE content_hash = ?", (content_hash,))
+            elif filename in document["aliases"]:
+                document["aliases"].remove(filename)
+                self._execute(
+                    "UPDATE documents SET data = ? WHERE content_hash = ?",
+                    (json.dumps(document), content_hash),
+                )
+
+
+DB_FUNCTIONS = (
+    "create_jobs_table",
+    "create_job",
+    "create_jobs",
+    "update_job",
+    "get_job",
+    "get_jobs",
+    "get_batch_jobs",
+    "get_document_by_hash",
+    "get_document_by_filename",
+    "create_document",
+    "add_document_alias",
+    "rename_document",
+    "retire_documents_for_filename",
+)
+
+
+def install(
+    embed_latency=0.0,
+    embed_item_latency=0.0,
+    chat_latency=0.0,
+    index_latency=0.0,
+    db_latency=0.0,
+    db_path=":memory:",
+    embedding_cache="redis",
+    hnsw=False,
+):
+    # Swap every external service for a local stand-in. Must run before main, sqs_worker, documents
+    # or job_events are imported — they bind the db/redis functions by name at import time.
+    if {"main", "sqs_worker", "documents"} & sys.modules.keys():
+        raise RuntimeError("benchmarks.fakes.install() must run before main/sqs_worker are imported")
+    if fakeredis is None:
+        raise RuntimeError("benchmarks need fakeredis — pip install -r benchmarks/requirements.txt")
+
+    # Clients are built at import from these — dummy values keep them from complaining
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["EMBEDDING_CACHE_BACKEND"] = embedding_cache
+
+    import redis_handler
+
+    server = fakeredis.FakeServer()
+    redis_handler.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_handler.async_redis_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    import openai_handler
+
+    openai_handler.client = FakeOpenAI(embed_latency, embed_item_latency, chat_latency)
+    openai_handler.async_client = AsyncFakeOpenAI(embed_latency, embed_item_latency, chat_latency)
+
+    import pinecone_handler
+
+    index = InMemoryIndex(latency=index_latency, hnsw=hnsw)
+    pinecone_handler.create_index_if_not_exists = lambda: index
+    pinecone_handler._index_host = "benchmark.local"
+    pinecone_handler._async_http = httpx.AsyncClient(transport=pinecone_transport(index))
+
+    import db_handler
+
+    store = SQLiteJobStore(db_path, latency=db_latency)
+    store.create_jobs_table()
+    for name in DB_FUNCTIONS:
+        setattr(db_handler, name, getattr(store, name))
+
+    import s3_handler
+    import sqs_handler
+
+    # S3 keys are local paths; presigned URLs are still signed by boto3, which needs no network
+    s3_handler.download_from_s3 = lambda s3_key, local_path: bool(shutil.copyfile(s3_key, local_path))
+    s3_handler.upload_to_s3 = lambda local_path, s3_key: bool(shutil.copyfile(local_path, s3_key))
+    queue = []
+    sqs_handler.enqueue_document = lambda job_id, s3_key, filename: queue.append(
+        {"job_id": job_id, "s3_key": s3_key, "filename": filename}
+    )
+
+    return SimpleNamespace(
+        redis=redis_handler.redis_client,
+        openai=openai_handler.client,
+        async_openai=openai_handler.async_client,
+        index=index,
+        db=store,
+        queue=queue,
+    )
@@ -0,0 +1,189 @@
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import itertools
+import httpx
+from benchmarks import fakes
+from benchmarks.corpus import write_corpus, synthetic_queries
+from benchmarks.stats import percentiles, format_table, write_json
+
+# Usage, from backend/:
+#   python -m benchmarks.load --endpoints query,presign-batch,status --concurrency 1,4,16,64 --duration 5
+#   python -m benchmarks.load --http ...   (same sweep through a real uvicorn socket)
+# Each concurrency level keeps that many requests in flight for --duration seconds.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrency sweep against the FastAPI app")
+    parser.add_argument("--endpoints", default="query,presign-batch,status")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64", help="comma-separated levels")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per level")
+    parser.add_argument("--warmup", type=float, default=0.5, help="seconds before each level is measured")
+    parser.add_argument("--http", action="store_true", help="serve over uvicorn instead of in-process ASGI")
+    parser.add_argument("--port", type=int, default=0, help="uvicorn port with --http (0 picks a free one)")
+    parser.add_argument("--docs", type=int, default=5, help="synthetic PDFs to ingest before querying")
+    parser.add_argument("--distinct-queries", type=int, default=10000)
+    parser.add_argument("--batch-files", type=int, default=10, help="filenames per /presign-batch call")
+    parser.add_argument("--status-jobs", type=int, default=1000, help="jobs seeded for /status reads")
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--chat-latency", type=float, default=0.0)
+    parser.add_argument("--index-latency", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="also write the curves to this file")
+    return parser.parse_args(argv)
+
+
+def build_requests(args):
+    # endpoint name -> function(i) returning the i-th request as (method, url, httpx kwargs)
+    from db_handler import create_jobs
+
+    queries = synthetic_queries(args.distinct_queries, seed=args.seed)
+    job_ids = [str(uuid.uuid4()) for _ in range(args.status_jobs)]
+    create_jobs([(job_id, f"status_{i}.pdf") for i, job_id in enumerate(job_ids)])
+    filenames = [f"load_{i}.pdf" for i in range(args.batch_files)]
+
+    return {
+        "query": lambda i: ("POST", "/query", {"params": {"query": queries[i % len(queries)]}}),
+        "presign-batch": lambda i: ("POST", "/presign-batch", {"json": {"filenames": filenames}}),
+        "status": lambda i: ("GET", f"/status/{job_ids[i % len(job_ids)]}", {}),
+    }
+
+
+async def run_level(client, make_request, concurrency, duration, warmup):
+    # Closed loop: concurrency workers each send their next request as soon as the last one returns.
+    # Requests that finish during warmup are sent but not counted.
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + warmup
+    deadline = measure_from + duration
+
+    async def worker():
+        nonlocal errors
+        while loop.time() < deadline:
+            method, url, kwargs = make_request(next(counter))
+            start = loop.time()
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if start >= measure_from:
+                latencies.append(loop.time() - start)
+                errors += failed
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        "concurrency": concurrency,
+        "rps": round(len(latencies) / duration, 2),
+        "errors": errors,
+        **percentiles(latencies),
+    }
+
+
+def saturation_point(curve, min_gain=1.1):
+    # First level where adding concurrency stopped buying at least min_gain more throughput —
+    # past this point extra requests only queue and tail latency climbs
+    for previous, current in zip(curve, curve[1:]):
+        if current["rps"] < previous["rps"] * min_gain:
+            return previous["concurrency"]
+    return None
+
+
+async def sweep(client, requests, endpoints, levels, duration, warmup):
+    curves = {}
+    for endpoint in endpoints:
+        curves[endpoint] = []
+        for concurrency in levels:
+            result = await run_level(client, requests[endpoint], concurrency, duration, warmup)
+            curves[endpoint].append(result)
+            print(f"{endpoint:>14} c={concurrency:<4} {result['rps']:>9} req/s  p99 {result.get('p99_ms')} ms")
+    return curves
+
+
+def start_server(app, port=0):
+    # uvicorn on a background thread; returns the server and the port it bound
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", port))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, sock.getsockname()[1]
+
+
+async def drive(app, requests, args, endpoints, levels, base_url):
+    if base_url:
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        client = httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits)
+    else:
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None)
+    async with client:
+        return await sweep(client, requests, endpoints, levels, args.duration, args.warmup)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    endpoints = args.endpoints.split(",")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    fakes.install(
+        embed_latency=args.embed_latency,
+        chat_latency=args.chat_latency,
+        index_latency=args.index_latency,
+        db_latency=args.db_latency,
+    )
+
+    import main as app_module
+    from benchmarks.run import run_ingest
+
+    app_module.limiter.enabled = False
+
+    # Something to retrieve, so /query goes through generation rather than "no documents"
+    with tempfile.TemporaryDirectory() as directory:
+        run_ingest(write_corpus(directory, documents=args.docs, seed=args.seed))
+
+    requests = build_requests(args)
+    unknown = set(endpoints) - set(requests)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    if args.http:
+        # The server gets its own thread and event loop, so client and app don't share one
+        server, thread, port = start_server(app_module.app, args.port)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            curves = asyncio.run(drive(app_module.app, requests, args, endpoints, levels, base_url))
+        finally:
+            server.should_exit = True
+            thread.join()
+    else:
+        curves = asyncio.run(drive(app_module.app, requests, args, endpoints, levels, None))
+
+    columns = ["concurrency", "rps", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    for endpoint, curve in curves.items():
+        print(f"\n{endpoint}  (saturates at concurrency {saturation_point(curve) or 'n/a'})")
+        print(format_table(curve, columns))
+
+    report = {
+        "config": vars(args),
+        "curves": curves,
+        "saturation": {endpoint: saturation_point(curve) for endpoint, curve in curves.items()},
+    }
+    if args.json_path:
+        write_json(args.json_path, report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
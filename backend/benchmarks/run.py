@@ -0,0 +1,181 @@
+import io
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from benchmarks import fakes
+from benchmarks.corpus import write_corpus, synthetic_queries
+from benchmarks.stats import percentiles, format_table, write_json
+
+# Usage, from backend/:
+#   python -m benchmarks.run --docs 20 --pages 20 --queries 500 --concurrency 16 --embed-latency 0.05
+# Latencies are simulated service times in seconds; 0 measures this code alone.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ingest and query benchmark")
+    parser.add_argument("--docs", type=int, default=10, help="synthetic PDFs to ingest")
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF")
+    parser.add_argument("--ingest-concurrency", type=int, default=1, help="worker invocations at once")
+    parser.add_argument("--queries", type=int, default=200, help="/query requests to send")
+    parser.add_argument("--distinct-queries", type=int, default=None, help="distinct questions among them")
+    parser.add_argument("--concurrency", type=int, default=8, help="/query requests in flight")
+    parser.add_argument("--searches", type=int, default=200, help="direct search_similar_chunks calls")
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--embed-item-latency", type=float, default=0.0)
+    parser.add_argument("--chat-latency", type=float, default=0.0)
+    parser.add_argument("--index-latency", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.0)
+    parser.add_argument("--hnsw", action="store_true", help="approximate search in the local index")
+    parser.add_argument("--embedding-cache", default="redis", choices=["redis", "disk", "none"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the worker's log lines")
+    return parser.parse_args(argv)
+
+
+def run_ingest(paths, concurrency=1, verbose=False):
+    # Each document goes through the real SQS worker handler; S3 downloads are local copies
+    import sqs_worker
+    from db_handler import create_job, get_job
+
+    jobs = []
+    for path in paths:
+        job_id = str(uuid.uuid4())
+        create_job(job_id, path.rsplit("/", 1)[-1])
+        jobs.append((job_id, path))
+
+    def ingest(job):
+        job_id, path = job
+        record = {
+            "messageId": job_id,
+            "body": json.dumps({"job_id": job_id, "s3_key": path, "filename": path.rsplit("/", 1)[-1]}),
+        }
+        return sqs_worker.handler({"Records": [record]}, None)
+
+    # The worker prints a timing line per job — keep the report readable unless asked
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(ingest, jobs))
+    elapsed = time.perf_counter() - start
+
+    rows = [get_job(job_id) for job_id, _ in jobs]
+    stages = {}
+    for row in rows:
+        for name, stage in json.loads(row.get("timings") or "{}").get("stages", {}).items():
+            stages[name] = stages.get(name, 0) + stage["seconds"]
+    pages = sum(row.get("pages_extracted", 0) for row in rows)
+    chunks = sum(row.get("chunks_created") or 0 for row in rows)
+    return {
+        "documents": len(rows),
+        "failed": sum(row["status"] != "completed" for row in rows),
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(rows) / elapsed, 2),
+        "pages_per_sec": round(pages / elapsed, 2),
+        "chunks_per_sec": round(chunks / elapsed, 2),
+        "chunks": chunks,
+        "stage_seconds": {name: round(seconds, 3) for name, seconds in sorted(stages.items())},
+    }
+
+
+def run_search(queries):
+    # search_similar_chunks directly, without the API layer — embedding, retrieval cache and index
+    from pinecone_handler import search_similar_chunks
+
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        call_start = time.perf_counter()
+        search_similar_chunks(query, top_k=5)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    return {"qps": round(len(queries) / elapsed, 2), **percentiles(latencies)}
+
+
+async def run_queries(app, queries, concurrency, path="/query"):
+    # Fixed number of in-flight requests against the ASGI app, each taking the next query when it finishes
+    latencies = []
+    errors = 0
+    pending = iter(queries)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None
+    ) as client:
+
+        async def worker():
+            nonlocal errors
+            for query in pending:
+                start = time.perf_counter()
+                response = await client.post(path, params={"query": query})
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "errors": errors,
+        "qps": round(len(latencies) / elapsed, 2),
+        **percentiles(latencies),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    services = fakes.install(
+        embed_latency=args.embed_latency,
+        embed_item_latency=args.embed_item_latency,
+        chat_latency=args.chat_latency,
+        index_latency=args.index_latency,
+        db_latency=args.db_latency,
+        embedding_cache=args.embedding_cache,
+        hnsw=args.hnsw,
+    )
+
+    import main as app_module
+    from metrics import query_percentiles
+
+    app_module.limiter.enabled = False
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_corpus(directory, documents=args.docs, pages=args.pages, seed=args.seed)
+        ingest = run_ingest(paths, args.ingest_concurrency, args.verbose)
+
+    queries = synthetic_queries(args.queries, args.distinct_queries, seed=args.seed)
+    search = run_search(synthetic_queries(args.searches, seed=args.seed + 1))
+    query = asyncio.run(run_queries(app_module.app, queries, args.concurrency))
+    stages = query_percentiles()
+
+    report = {
+        "config": vars(args),
+        "ingest": ingest,
+        "search": search,
+        "query": query,
+        "query_stages": stages,
+        "service_calls": {**services.openai.calls, **{f"async_{k}": v for k, v in services.async_openai.calls.items()}},
+    }
+
+    print("Ingest")
+    print(format_table([{k: v for k, v in ingest.items() if k != "stage_seconds"}]))
+    print(format_table([{"stage": k, "seconds": v} for k, v in ingest["stage_seconds"].items()]))
+    print("\nsearch_similar_chunks")
+    print(format_table([search]))
+    print("\n/query")
+    print(format_table([query]))
+    print(format_table([{"stage": name, **values} for name, values in sorted(stages.items())]))
+
+    if args.json_path:
+        write_json(args.json_path, report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import json
+
+
+def percentiles(samples):
+    # Latency summary in milliseconds from a list of durations in seconds
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(at(0.5) * 1000, 2),
+        "p95_ms": round(at(0.95) * 1000, 2),
+        "p99_ms": round(at(0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def format_table(rows, columns=None):
+    # Plain-text table from a list of dicts — columns default to the keys of the first row
+    if not rows:
+        return ""
+    columns = columns or list(rows[0])
+    cells = [[row.get(c, "") for c in columns] for row in rows]
+    widths = [max(len(c), *(len(str(r[i])) for r in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    # Numbers right-aligned, labels left-aligned
+    lines.extend(
+        "  ".join(
+            str(v).rjust(w) if isinstance(v, (int, float)) else str(v).ljust(w)
+            for v, w in zip(r, widths)
+        )
+        for r in cells
+    )
+    return "\n".join(lines)
+
+
+def write_json(path, report):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, default=str)
@@ -1,67 +1,300 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import os
+import time
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Pool settings — the pool lives at module level so warm Lambda invocations reuse its connections
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 5))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+# Connections idle longer than this are pinged before use — a frozen Lambda's sockets go stale
+DB_HEALTHCHECK_IDLE = float(os.getenv("DB_HEALTHCHECK_IDLE", 30))
 
-def get_connection():
-    return psycopg2.connect(
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+
+
+def _connection_params():
+    return dict(
         host=os.getenv("DB_HOST"),
         port=int(os.getenv("DB_PORT", 5432)),
         dbname=os.getenv("DB_NAME"),
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASSWORD"),
+        connect_timeout=DB_CONNECT_TIMEOUT,
     )
 
 
-def create_jobs_table():
-    conn = get_connection()
-    with conn:
+def get_connection():
+    # Unpooled connection, for one-off scripts
+    return psycopg2.connect(**_connection_params())
+
+
+def get_pool():
+    # Created on first use, not at import — importing this module never touches the network
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, **_connection_params()
+                )
+    return _pool
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    # Fresh connections and recently used ones skip the ping
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_HEALTHCHECK_IDLE:
+        return True
+    try:
         with conn.cursor() as cur:
-            cur.execute(
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def pooled_connection():
+    # Check a connection out of the pool, replacing it if it went stale, and always return it.
+    # ThreadedConnectionPool raises instead of waiting when exhausted, so a semaphore makes
+    # callers queue for up to DB_POOL_TIMEOUT seconds.
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise psycopg2.pool.PoolError("Timed out waiting for a database connection")
+
+    pool = None
+    conn = None
+    broken = False
+    try:
+        # Inside the try — if the DB is unreachable at cold start the slot must still be released
+        pool = get_pool()
+        conn = pool.getconn()
+        # Several idle connections may have gone stale together — replace until one works
+        for _ in range(DB_POOL_MAX):
+            if _is_healthy(conn):
+                break
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # Server closed it or the network dropped — don't hand this one out again
+        broken = True
+        raise
+    finally:
+        if conn is not None:
+            close = broken or bool(conn.closed)
+            if close:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=close)
+        _pool_slots.release()
+
+
+def create_jobs_table():
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        job_id         VARCHAR(36) PRIMARY KEY,
+                        filename       TEXT NOT NULL,
+                        status         TEXT NOT NULL DEFAULT 'queued',
+                        chunks_created INTEGER,
+                        s3_key         TEXT,
+                        error          TEXT,
+                        created_at     TIMESTAMP DEFAULT NOW()
+                    )
+                """
+                )
+                cur.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS content_hash TEXT")
+                # Groups the jobs of one /presign-batch call so they can be polled together
+                cur.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS batch_id VARCHAR(36)")
+                cur.execute("CREATE INDEX IF NOT EXISTS jobs_batch_id ON jobs (batch_id)")
+                # Ingest progress, written by the worker at throttled intervals, and when each stage finished
+                cur.execute(
+                    """
+                    ALTER TABLE jobs
+                        ADD COLUMN IF NOT EXISTS pages_extracted     INTEGER NOT NULL DEFAULT 0,
+                        ADD COLUMN IF NOT EXISTS chunks_embedded     INTEGER NOT NULL DEFAULT 0,
+                        ADD COLUMN IF NOT EXISTS vectors_upserted    INTEGER NOT NULL DEFAULT 0,
+                        ADD COLUMN IF NOT EXISTS progress_updated_at TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS started_at          TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS downloaded_at       TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS extracted_at        TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS indexed_at          TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS completed_at        TIMESTAMPTZ,
+                        ADD COLUMN IF NOT EXISTS timings             JSONB
+                """
+                )
+                # One row per unique file body — lets the worker skip re-embedding a re-upload
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS documents (
+                        content_hash   VARCHAR(64) PRIMARY KEY,
+                        filename       TEXT NOT NULL,
+                        aliases        TEXT[] NOT NULL DEFAULT '{}',
+                        chunks_created INTEGER,
+                        created_at     TIMESTAMP DEFAULT NOW()
+                    )
                 """
-                CREATE TABLE IF NOT EXISTS jobs (
-                    job_id         VARCHAR(36) PRIMARY KEY,
-                    filename       TEXT NOT NULL,
-                    status         TEXT NOT NULL DEFAULT 'queued',
-                    chunks_created INTEGER,
-                    s3_key         TEXT,
-                    error          TEXT,
-                    created_at     TIMESTAMP DEFAULT NOW()
                 )
-            """
-            )
-    conn.close()
 
 
 def create_job(job_id, filename, status="pending"):
-    conn = get_connection()
-    with conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO jobs (job_id, filename, status) VALUES (%s, %s, %s)",
-                (job_id, filename, status),
-            )
-    conn.close()
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO jobs (job_id, filename, status) VALUES (%s, %s, %s)",
+                    (job_id, filename, status),
+                )
+
+
+def create_jobs(jobs, status="pending", batch_id=None):
+    # Bulk version of create_job for a list of (job_id, filename) — one multi-row INSERT in one
+    # transaction instead of a round trip per file
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur,
+                    "INSERT INTO jobs (job_id, filename, status, batch_id) VALUES %s",
+                    [(job_id, filename, status, batch_id) for job_id, filename in jobs],
+                    page_size=1000,
+                )
 
 
 def update_job(job_id, **kwargs):
     # Builds SET clause from whatever fields are passed — avoids a separate function per field
     fields = ", ".join(f"{k} = %s" for k in kwargs)
     values = list(kwargs.values()) + [job_id]
-    conn = get_connection()
-    with conn:
-        with conn.cursor() as cur:
-            cur.execute(f"UPDATE jobs SET {fields} WHERE job_id = %s", values)
-    conn.close()
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(f"UPDATE jobs SET {fields} WHERE job_id = %s", values)
 
 
 def get_job(job_id):
-    conn = get_connection()
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute("SELECT * FROM jobs WHERE job_id = %s", (job_id,))
-        row = cur.fetchone()
-    conn.close()
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute("SELECT * FROM jobs WHERE job_id = %s", (job_id,))
+                row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def get_jobs(job_ids):
+    # Many jobs in one query — for status polling of a whole upload
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute("SELECT * FROM jobs WHERE job_id = ANY(%s)", (list(job_ids),))
+                rows = cur.fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_batch_jobs(batch_id):
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(
+                    "SELECT * FROM jobs WHERE batch_id = %s ORDER BY created_at, job_id",
+                    (batch_id,),
+                )
+                rows = cur.fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_document_by_hash(content_hash):
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute("SELECT * FROM documents WHERE content_hash = %s", (content_hash,))
+                row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def get_document_by_filename(filename):
+    # The document whose chunks are stored under filename — the newest row, should older ones remain
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(
+                    "SELECT * FROM documents WHERE filename = %s ORDER BY created_at DESC LIMIT 1",
+                    (filename,),
+                )
+                row = cur.fetchone()
     return dict(row) if row else None
+
+
+def create_document(content_hash, filename, chunks_created):
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                # Two workers may index the same file concurrently — first one wins
+                cur.execute(
+                    """
+                    INSERT INTO documents (content_hash, filename, chunks_created)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (content_hash) DO NOTHING
+                    """,
+                    (content_hash, filename, chunks_created),
+                )
+
+
+def add_document_alias(content_hash, filename):
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE documents SET aliases = array_append(aliases, %s)
+                    WHERE content_hash = %s AND filename <> %s AND NOT (%s = ANY(aliases))
+                    """,
+                    (filename, content_hash, filename, filename),
+                )
+
+
+def rename_document(content_hash, filename):
+    # Make one of a document's aliases the filename its chunks are stored under
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE documents SET filename = %s, aliases = array_remove(aliases, %s)
+                    WHERE content_hash = %s
+                    """,
+                    (filename, filename, content_hash),
+                )
+
+
+def retire_documents_for_filename(filename):
+    # Called before filename's vectors are rewritten — any document recorded as stored under it, or
+    # deduplicated onto it, stops being a valid dedup target. Without this a later upload of the old
+    # bytes would be aliased to vectors that now hold different text.
+    with pooled_connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM documents WHERE filename = %s", (filename,))
+                cur.execute(
+                    "UPDATE documents SET aliases = array_remove(aliases, %s) WHERE %s = ANY(aliases)",
+                    (filename, filename),
+                )
@@ -1,22 +1,137 @@
+import os
+import hashlib
+import multiprocessing
 import PyPDF2
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
 
-def extract_text_from_pdf(file_path):
-    # Extract text from a PDF file
-    text = ""
+# PDFs with fewer pages than this are extracted in-process — forking isn't worth it for small files
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 100))
+PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", os.cpu_count() or 1))
+
+
+def iter_pdf_pages(file_path, workers=None):
+    # Yield (page_number, text) one page at a time so callers never hold the whole document
+    workers = PARALLEL_WORKERS if workers is None else workers
     with open(file_path, "rb") as file:
         pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
+        page_count = len(pdf_reader.pages)
+
+        if workers > 1 and page_count >= PARALLEL_MIN_PAGES:
+            yield from _iter_pages_parallel(file_path, page_count, workers)
+            return
+
+        for page_number, page in enumerate(pdf_reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+
+
+def _extract_page_range(file_path, start, end, conn):
+    # Runs in a child process — each worker opens its own reader and parses only its shard
+    try:
+        with open(file_path, "rb") as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            texts = [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+        conn.send((texts, None))
+    except Exception as e:
+        conn.send((None, str(e)))
+    finally:
+        conn.close()
+
+
+def _iter_pages_parallel(file_path, page_count, workers):
+    # Shard contiguous page ranges across worker processes, then yield shards back in page order.
+    # Uses Process + Pipe rather than multiprocessing.Pool — Lambda has no /dev/shm, so Pool's
+    # semaphores fail there while plain pipes work.
+    shard_size = -(-page_count // workers)
+    shards = []
+    try:
+        for start in range(0, page_count, shard_size):
+            end = min(start + shard_size, page_count)
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_extract_page_range, args=(file_path, start, end, child_conn)
+            )
+            process.start()
+            child_conn.close()
+            shards.append((start, parent_conn, process))
+    except OSError as e:
+        # Can't spawn processes here — fall back to the serial path for the rest of the document
+        print(f"Parallel PDF extraction unavailable: {e}")
+        for _, parent_conn, process in shards:
+            parent_conn.close()
+            process.terminate()
+            process.join()
+        yield from iter_pdf_pages(file_path, workers=1)
+        return
+
+    try:
+        for start, parent_conn, process in shards:
+            # Receive before join — a child blocks on send until its pipe is drained
+            texts, error = parent_conn.recv()
+            process.join()
+            if error:
+                raise Exception(f"PDF extraction failed: {error}")
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+    finally:
+        for _, parent_conn, process in shards:
+            parent_conn.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    # SHA-256 of the file body, read in blocks — identifies a document regardless of its filename
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_text_from_pdf(file_path, workers=None):
+    # Extract text from a PDF file — large files are split across worker processes
+    return "".join(text for _, text in iter_pdf_pages(file_path, workers=workers))
+
+
+def _get_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+    )
 
 
 def chunk_text(text):
     # Split text into chunks respecting sentence boundaries
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-    )
+    splitter = _get_splitter()
     chunks = splitter.split_text(text)
     return chunks
+
+
+def chunk_pages(pages, buffer_pages=2):
+    # Streaming version of chunk_text — takes (page_number, text) pairs and yields chunks as soon
+    # as they can no longer change. The last chunk of each split is held back and re-split with the
+    # next pages, so memory stays bounded by a few pages instead of the whole document.
+    splitter = _get_splitter()
+    buffer = ""
+    pending_pages = 0
+
+    for _, text in pages:
+        buffer += text
+        pending_pages += 1
+        if pending_pages < buffer_pages:
+            continue
+
+        chunks = splitter.split_text(buffer)
+        if len(chunks) > 1:
+            yield from chunks[:-1]
+            # Carry the unfinished tail forward, starting where the last chunk starts
+            tail_start = buffer.rfind(chunks[-1])
+            buffer = buffer[tail_start:] if tail_start != -1 else chunks[-1]
+        pending_pages = 0
+
+    if buffer:
+        yield from splitter.split_text(buffer)
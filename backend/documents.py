@@ -0,0 +1,18 @@
+from db_handler import get_document_by_filename, rename_document, retire_documents_for_filename
+from pinecone_handler import copy_document_vectors, delete_document_vectors
+
+
+def release_filename(filename, delete_vectors=False):
+    # Called before filename's vectors are rewritten (or, with delete_vectors, removed).
+    # Uploads deduplicated onto filename have no vectors of their own, so the first of them takes
+    # over a copy of the stored chunks and becomes the document's filename — the rest stay its
+    # aliases. Every other dedup record pointing at filename is then retired, so a later upload of
+    # the old bytes can't be aliased to vectors that hold different text.
+    document = get_document_by_filename(filename)
+    if document and document["aliases"]:
+        successor = document["aliases"][0]
+        copy_document_vectors(filename, successor)
+        rename_document(document["content_hash"], successor)
+    retire_documents_for_filename(filename)
+    # Returns how many vectors were deleted
+    return delete_document_vectors(filename) if delete_vectors else 0
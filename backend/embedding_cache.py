@@ -0,0 +1,153 @@
+import os
+import time
+import base64
+import hashlib
+import sqlite3
+import threading
+from array import array
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "redis" (shared across Lambda containers), "disk" (local SQLite file) or "none"
+CACHE_BACKEND = os.getenv("EMBEDDING_CACHE_BACKEND", "redis")
+MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+DISK_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/tmp/embedding_cache.sqlite3")
+REDIS_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 30 * 24 * 3600))
+
+
+def cache_key(model, text):
+    return f"emb:{model}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+
+def _pack(embedding):
+    # float32 halves the size of a 1536-dim vector compared to JSON floats
+    return array("f", embedding).tobytes()
+
+
+def _unpack(data):
+    return array("f", data).tolist()
+
+
+class RedisEmbeddingCache:
+    # Entries live under emb:* keys; a sorted set of last-access times drives LRU eviction
+    LRU_KEY = "emb:lru"
+
+    def __init__(self, client, max_entries=MAX_ENTRIES, ttl=REDIS_TTL):
+        self.client = client
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        values = self.client.mget(keys)
+        hits = {k: _unpack(base64.b64decode(v)) for k, v in zip(keys, values) if v}
+        if hits:
+            now = time.time()
+            self.client.zadd(self.LRU_KEY, {k: now for k in hits})
+        return hits
+
+    def set_many(self, items):
+        now = time.time()
+        pipe = self.client.pipeline()
+        for key, embedding in items.items():
+            pipe.setex(key, self.ttl, base64.b64encode(_pack(embedding)).decode())
+        pipe.zadd(self.LRU_KEY, {k: now for k in items})
+        # Entries unused for a whole TTL have expired — drop them so they don't count towards max_entries
+        pipe.zremrangebyscore(self.LRU_KEY, "-inf", now - self.ttl)
+        pipe.zcard(self.LRU_KEY)
+        size = pipe.execute()[-1]
+
+        if size > self.max_entries:
+            evicted = [k for k, _ in self.client.zpopmin(self.LRU_KEY, size - self.max_entries)]
+            if evicted:
+                self.client.delete(*evicted)
+
+
+class DiskEmbeddingCache:
+    # SQLite file — survives between invocations on a warm container and between local runs
+    def __init__(self, path=DISK_PATH, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+
+    def get_many(self, keys):
+        hits = {}
+        now = time.time()
+        with self.lock, self.conn:
+            # SQLite caps bound parameters per statement, so look keys up in slices
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                hits.update({k: _unpack(v) for k, v in rows})
+                self.conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                    [now] + batch,
+                )
+        return hits
+
+    def set_many(self, items):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(k, _pack(v), now) for k, v in items.items()],
+            )
+            size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if size > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (size - self.max_entries,),
+                )
+
+
+_cache = None
+
+
+def get_cache():
+    # Created on first use so importing this module never opens a connection or file
+    global _cache
+    if _cache is None and CACHE_BACKEND == "redis":
+        from redis_handler import redis_client
+
+        _cache = RedisEmbeddingCache(redis_client)
+    elif _cache is None and CACHE_BACKEND == "disk":
+        _cache = DiskEmbeddingCache()
+    return _cache
+
+
+def get_cached_embeddings(model, texts):
+    # Returns a list aligned with texts — the cached embedding, or None on a miss
+    cache = get_cache()
+    if cache is None or not texts:
+        return [None] * len(texts)
+    keys = [cache_key(model, t) for t in texts]
+    try:
+        hits = cache.get_many(list(dict.fromkeys(keys)))
+    except Exception as e:
+        print(f"Embedding cache get error: {e}")
+        return [None] * len(texts)
+    return [hits.get(k) for k in keys]
+
+
+def cache_embeddings(model, texts, embeddings):
+    cache = get_cache()
+    if cache is None or not texts:
+        return False
+    try:
+        cache.set_many({cache_key(model, t): e for t, e in zip(texts, embeddings)})
+        return True
+    except Exception as e:
+        print(f"Embedding cache set error: {e}")
+        return False
@@ -0,0 +1,61 @@
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from db_handler import update_job
+from redis_handler import publish_job_event
+
+# Progress changes on every page and batch — publish at most this often, write to the DB even less
+JOB_PROGRESS_PUBLISH_INTERVAL = float(os.getenv("JOB_PROGRESS_PUBLISH_INTERVAL", 1))
+JOB_PROGRESS_DB_INTERVAL = float(os.getenv("JOB_PROGRESS_DB_INTERVAL", 5))
+
+
+def update_job_status(job_id, **fields):
+    # Persist a job change and push it to anyone streaming /jobs/stream for this job
+    update_job(job_id, **fields)
+    publish_job_event(job_id, **fields)
+
+
+class JobProgress:
+    # Collects ingest counters (pages_extracted, chunks_embedded, vectors_upserted) for one job.
+    # update() may be called per page or per batch, from any thread; the row is only written
+    # every JOB_PROGRESS_DB_INTERVAL seconds so progress tracking can't become a DB hot spot.
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.published_at = 0.0
+        self.written_at = time.monotonic()
+
+    def update(self, **counts):
+        with self.lock:
+            self.counts.update(counts)
+            now = time.monotonic()
+            publish = now - self.published_at >= JOB_PROGRESS_PUBLISH_INTERVAL
+            write = now - self.written_at >= JOB_PROGRESS_DB_INTERVAL
+            if publish:
+                self.published_at = now
+            if write:
+                self.written_at = now
+            snapshot = dict(self.counts)
+
+        if publish:
+            publish_job_event(self.job_id, status="processing", **snapshot)
+        if write:
+            update_job(self.job_id, progress_updated_at=datetime.now(timezone.utc), **snapshot)
+
+    def stage(self, name, status="processing", **fields):
+        # Stage boundaries are always written, along with the latest counters. Every event carries
+        # the job's status — stream clients replace their copy of the job with each one.
+        with self.lock:
+            self.written_at = self.published_at = time.monotonic()
+            snapshot = dict(self.counts)
+        now = datetime.now(timezone.utc)
+        update_job_status(
+            self.job_id,
+            **snapshot,
+            **fields,
+            status=status,
+            progress_updated_at=now,
+            **{f"{name}_at": now},
+        )
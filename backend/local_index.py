@@ -0,0 +1,255 @@
+import os
+import json
+import atexit
+import threading
+from types import SimpleNamespace
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# On-disk location of the index — unset keeps it in memory only
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH")
+# Approximate search with an HNSW graph (needs hnswlib) instead of scanning every vector —
+# worth it from roughly 100k vectors up
+LOCAL_INDEX_HNSW = os.getenv("LOCAL_INDEX_HNSW", "false").lower() == "true"
+HNSW_M = int(os.getenv("LOCAL_INDEX_HNSW_M", 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF_SEARCH = int(os.getenv("LOCAL_INDEX_HNSW_EF_SEARCH", 64))
+
+
+class LocalIndex:
+    # In-process vector index with the subset of the Pinecone Index interface this repo uses:
+    # upsert, query, list, fetch, delete and describe_index_stats.
+    # Vectors are normalised rows of a float32 matrix, so cosine similarity is one matrix-vector
+    # product. Rows never move: deleted rows are masked out and reused, which keeps row numbers
+    # valid as HNSW labels.
+    def __init__(self, dimension=1536, path=LOCAL_INDEX_PATH, hnsw=LOCAL_INDEX_HNSW):
+        if hnsw and hnswlib is None:
+            print("LOCAL_INDEX_HNSW is set but hnswlib is not installed — using brute-force search")
+            hnsw = False
+        self.dimension = dimension
+        self.path = path
+        self.use_hnsw = hnsw
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.loaded_mtime = None
+        self._reset()
+        if path and os.path.exists(f"{path}.json"):
+            self.load()
+
+    def _reset(self, capacity=1024):
+        self.matrix = np.zeros((capacity, self.dimension), dtype=np.float32)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.ids = [None] * capacity
+        self.metadata = [None] * capacity
+        self.rows = {}
+        self.free = []
+        self.size = 0  # rows ever used; free holds deleted rows below it
+        self.hnsw = None
+        if self.use_hnsw:
+            self.hnsw = hnswlib.Index(space="ip", dim=self.dimension)
+            self.hnsw.init_index(max_elements=capacity, M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+
+    def _grow(self, needed):
+        capacity = len(self.live)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        extra = capacity - len(self.live)
+        self.matrix = np.vstack([self.matrix, np.zeros((extra, self.dimension), dtype=np.float32)])
+        self.live = np.concatenate([self.live, np.zeros(extra, dtype=bool)])
+        self.ids.extend([None] * extra)
+        self.metadata.extend([None] * extra)
+        if self.hnsw is not None:
+            self.hnsw.resize_index(capacity)
+
+    def upsert(self, vectors):
+        with self.lock:
+            values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+            norms = np.linalg.norm(values, axis=1, keepdims=True)
+            values /= np.where(norms == 0, 1, norms)
+
+            new_count = len({v["id"] for v in vectors} - self.rows.keys())
+            self._grow(self.size + max(0, new_count - len(self.free)))
+
+            rows = []
+            for vector in vectors:
+                row = self.rows.get(vector["id"])
+                if row is None:
+                    row = self.free.pop() if self.free else self.size
+                    self.size = max(self.size, row + 1)
+                    self.rows[vector["id"]] = row
+                    self.ids[row] = vector["id"]
+                    if self.hnsw is not None and not self.live[row] and row < self.hnsw.get_current_count():
+                        self.hnsw.unmark_deleted(row)
+                self.metadata[row] = vector.get("metadata", {})
+                self.live[row] = True
+                rows.append(row)
+
+            self.matrix[rows] = values
+            if self.hnsw is not None:
+                # The same id twice in one batch — keep the last one, as the matrix does
+                last = dict(zip(rows, range(len(rows))))
+                self.hnsw.add_items(values[list(last.values())], list(last))
+            self.dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k=10, include_metadata=False, **kwargs):
+        self._reload_if_changed()
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        with self.lock:
+            count = int(self.live.sum())
+            top_k = min(top_k, count)
+            if top_k == 0:
+                return {"matches": []}
+
+            if self.hnsw is not None:
+                self.hnsw.set_ef(max(HNSW_EF_SEARCH, top_k))
+                labels, distances = self.hnsw.knn_query(query, k=top_k)
+                best, scores = labels[0], 1 - distances[0]
+            else:
+                # Vectorised cosine over every used row; deleted rows can never win
+                similarities = self.matrix[: self.size] @ query
+                similarities[~self.live[: self.size]] = -np.inf
+                best = np.argpartition(-similarities, top_k - 1)[:top_k]
+                best = best[np.argsort(-similarities[best])]
+                scores = similarities[best]
+
+            return {
+                "matches": [
+                    {
+                        "id": self.ids[row],
+                        "score": float(score),
+                        **({"metadata": self.metadata[row]} if include_metadata else {}),
+                    }
+                    for row, score in zip(best, scores)
+                ]
+            }
+
+    def list(self, prefix="", limit=100):
+        # Pages of ids, like the Pinecone list() generator
+        with self.lock:
+            ids = sorted(i for i in self.rows if i.startswith(prefix))
+        for i in range(0, len(ids), limit):
+            yield ids[i : i + limit]
+
+    def fetch(self, ids):
+        with self.lock:
+            vectors = {
+                i: SimpleNamespace(
+                    id=i,
+                    values=self.matrix[self.rows[i]].tolist(),
+                    metadata=self.metadata[self.rows[i]],
+                )
+                for i in ids
+                if i in self.rows
+            }
+        return SimpleNamespace(vectors=vectors)
+
+    def delete(self, ids):
+        with self.lock:
+            for vector_id in ids:
+                row = self.rows.pop(vector_id, None)
+                if row is None:
+                    continue
+                self.live[row] = False
+                self.ids[row] = None
+                self.metadata[row] = None
+                self.free.append(row)
+                if self.hnsw is not None:
+                    self.hnsw.mark_deleted(row)
+            self.dirty = True
+
+    def describe_index_stats(self):
+        with self.lock:
+            return {"dimension": self.dimension, "total_vector_count": len(self.rows)}
+
+    def persist(self):
+        # Written after each ingest rather than on every upsert batch. Each file is written then
+        # renamed so none is read half-written; the JSON file goes last since readers watch it.
+        if not self.path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.npy.tmp", "wb") as file:
+                np.save(file, self.matrix[: self.size])
+            os.replace(f"{self.path}.npy.tmp", f"{self.path}.npy")
+            if self.hnsw is not None:
+                self.hnsw.save_index(f"{self.path}.hnsw.tmp")
+                os.replace(f"{self.path}.hnsw.tmp", f"{self.path}.hnsw")
+            state = {
+                "dimension": self.dimension,
+                "ids": self.ids[: self.size],
+                "metadata": self.metadata[: self.size],
+            }
+            with open(f"{self.path}.json.tmp", "w") as file:
+                json.dump(state, file)
+            os.replace(f"{self.path}.json.tmp", f"{self.path}.json")
+            self.dirty = False
+            self.loaded_mtime = os.path.getmtime(f"{self.path}.json")
+
+    def load(self):
+        with self.lock:
+            with open(f"{self.path}.json") as file:
+                state = json.load(file)
+            matrix = np.load(f"{self.path}.npy")
+            size = len(state["ids"])
+            self.dimension = state["dimension"]
+            self._reset(capacity=max(1024, size))
+            self.matrix[:size] = matrix[:size]
+            self.size = size
+            for row, vector_id in enumerate(state["ids"]):
+                if vector_id is None:
+                    self.free.append(row)
+                    continue
+                self.rows[vector_id] = row
+                self.ids[row] = vector_id
+                self.metadata[row] = state["metadata"][row]
+                self.live[row] = True
+
+            if self.hnsw is not None:
+                if os.path.exists(f"{self.path}.hnsw"):
+                    self.hnsw = hnswlib.Index(space="ip", dim=self.dimension)
+                    self.hnsw.load_index(f"{self.path}.hnsw", max_elements=len(self.live))
+                elif size:
+                    # Saved without HNSW — build the graph from the stored vectors
+                    self.hnsw.add_items(self.matrix[:size], np.arange(size))
+                    for row in self.free:
+                        self.hnsw.mark_deleted(row)
+            self.dirty = False
+            self.loaded_mtime = os.path.getmtime(f"{self.path}.json")
+
+    def _reload_if_changed(self):
+        # Another process (e.g. the ingest worker) may have persisted a newer index to the same path
+        if not self.path or self.dirty:
+            return
+        try:
+            mtime = os.path.getmtime(f"{self.path}.json")
+        except OSError:
+            return
+        if self.loaded_mtime is None or mtime > self.loaded_mtime:
+            self.load()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index(dimension=1536):
+    # One index per process, loaded from LOCAL_INDEX_PATH on first use
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LocalIndex(dimension=dimension)
+                atexit.register(_index.persist)
+    return _index
@@ -1,9 +1,12 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request, Response
 from pydantic import BaseModel
 from typing import List
 from dotenv import load_dotenv
 import os
+import json
+import time
 import shutil
+import asyncio
 import uuid
 from document_processor import extract_text_from_pdf, chunk_text
 from pinecone_handler import store_chunks, create_index_if_not_exists
@@ -12,8 +15,34 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from s3_handler import upload_to_s3, generate_presigned_url
 from fastapi.middleware.cors import CORSMiddleware
-from redis_handler import get_cached_query, cache_query_result
-from db_handler import create_jobs_table, create_job, update_job, get_job
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from redis_handler import (
+    get_cached_query,
+    cache_query_result,
+    get_semantic_cached_query,
+    cache_semantic_query,
+    bump_corpus_version,
+    async_redis_client,
+    job_channel,
+    query_cache_key,
+    acquire_query_lock,
+    query_lock_held,
+    release_query_lock,
+    get_cache_stats,
+    QUERY_LOCK_TTL,
+)
+from db_handler import (
+    create_jobs_table,
+    create_job,
+    create_jobs,
+    get_job,
+    get_jobs,
+    get_batch_jobs,
+)
+from job_events import update_job_status
+from documents import release_filename
+from metrics import start_request_timer, request_stage, render_query_prometheus
 from sqs_handler import enqueue_document
 
 load_dotenv()
@@ -42,7 +71,7 @@ create_jobs_table()
 def process_document_task(job_id, file_path, filename):
     # Background task to process document
     try:
-        update_job(job_id, status="processing")
+        update_job_status(job_id, status="processing")
 
         # Upload to S3
         s3_key = f"documents/{filename}"
@@ -52,15 +81,17 @@ def process_document_task(job_id, file_path, filename):
         text = extract_text_from_pdf(file_path)
         chunks = chunk_text(text)
 
-        # Store in Pinecone
+        # Store in Pinecone — this overwrites filename's vectors, so release them first
+        release_filename(filename)
         chunk_count = store_chunks(chunks, filename)
+        bump_corpus_version()
 
         # Clean up local file
         os.remove(file_path)
 
-        update_job(job_id, status="completed", chunks_created=chunk_count, s3_key=s3_key)
+        update_job_status(job_id, status="completed", chunks_created=chunk_count, s3_key=s3_key)
     except Exception as e:
-        update_job(job_id, status="failed", error=str(e))
+        update_job_status(job_id, status="failed", error=str(e))
 
 
 
@@ -97,16 +128,27 @@ class BatchPresignRequest(BaseModel):
 @app.post("/presign-batch")
 async def get_presigned_urls_batch(request: BatchPresignRequest):
     # Generate a presigned URL and job entry for each file in one shot
-    results = []
     for filename in request.filenames:
         if not filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail=f"{filename} is not a PDF")
-        job_id = str(uuid.uuid4())
-        s3_key = f"documents/{filename}"
-        upload_url = generate_presigned_url(s3_key)
-        create_job(job_id, filename, status="pending")
-        results.append({"job_id": job_id, "upload_url": upload_url, "s3_key": s3_key})
-    return results
+
+    # batch_id lets the client poll every file of this upload with one request
+    batch_id = str(uuid.uuid4())
+    job_ids = [str(uuid.uuid4()) for _ in request.filenames]
+    s3_keys = [f"documents/{filename}" for filename in request.filenames]
+
+    # URLs are signed in parallel while all job rows go in with a single INSERT
+    upload_urls, _ = await asyncio.gather(
+        asyncio.gather(*(run_in_threadpool(generate_presigned_url, key) for key in s3_keys)),
+        run_in_threadpool(
+            create_jobs, list(zip(job_ids, request.filenames)), "pending", batch_id
+        ),
+    )
+
+    return [
+        {"job_id": job_id, "upload_url": upload_url, "s3_key": s3_key, "batch_id": batch_id}
+        for job_id, upload_url, s3_key in zip(job_ids, upload_urls, s3_keys)
+    ]
 
 
 @app.post("/confirm")
@@ -115,7 +157,7 @@ async def confirm_upload(job_id: str, s3_key: str):
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    update_job(job_id, status="queued")
+    update_job_status(job_id, status="queued")
     enqueue_document(job_id, s3_key, job["filename"])
 
     return {"job_id": job_id, "status": "queued"}
@@ -155,22 +197,137 @@ def check_status(job_id: str):
     return job
 
 
+async def _lookup_cached_answer(query, cache_stage="cache"):
+    # Exact-match cache first, then the semantic cache — returns (cached result, query embedding).
+    # The embedding computed for the semantic lookup is reused for the Pinecone search on a miss.
+    # The Redis client is sync, so keep it off the event loop.
+    # cache_stage names the exact-cache timing, so a re-check isn't mixed into the first lookup's numbers
+    with request_stage(cache_stage):
+        cached_result = await run_in_threadpool(get_cached_query, query)
+    if cached_result:
+        return cached_result, None
+
+    from openai_handler import agenerate_embedding
+
+    with request_stage("embed"):
+        query_embedding = await agenerate_embedding(query)
+    with request_stage("semantic"):
+        cached_result = await run_in_threadpool(get_semantic_cached_query, query_embedding)
+        if cached_result:
+            # Similar question answered before — store it under this phrasing too
+            cached_result = {**cached_result, "query": query}
+            await run_in_threadpool(cache_query_result, query, cached_result)
+    return cached_result, query_embedding
+
+
+async def _cache_answer(query, query_embedding, result):
+    with request_stage("cache_write"):
+        await run_in_threadpool(cache_query_result, query, result)
+        await run_in_threadpool(cache_semantic_query, query, query_embedding, result)
+
+
+# In-flight /query computations in this process, keyed like the answer cache
+_inflight_queries = {}
+
+
+async def _single_flight(query, compute):
+    # Concurrent identical queries in this process share one task. shield() keeps a
+    # disconnecting client from cancelling the computation the others are waiting on.
+    # The key reads the corpus generation, which may hit Redis — keep that off the event loop
+    key = await run_in_threadpool(query_cache_key, query)
+    task = _inflight_queries.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_compute_once_across_instances(query, key, compute))
+        _inflight_queries[key] = task
+        task.add_done_callback(lambda _: _inflight_queries.pop(key, None))
+        return await asyncio.shield(task)
+
+    # Someone else's run is timing the individual stages — we only see the wait
+    with request_stage("coalesced"):
+        return await asyncio.shield(task)
+
+
+async def _compute_once_across_instances(query, key, compute, poll_interval=0.1):
+    # Other instances coordinate through a short Redis lock — whoever holds it computes and
+    # caches the answer, the rest poll the cache until it appears or the lock goes away.
+    # key is the query_cache_key, fixed for the whole request so the lock we release is the one we took
+    token = await run_in_threadpool(acquire_query_lock, key)
+    if token is None:
+        with request_stage("lock_wait"):
+            deadline = time.monotonic() + QUERY_LOCK_TTL
+            while time.monotonic() < deadline:
+                await asyncio.sleep(poll_interval)
+                cached_result = await run_in_threadpool(get_cached_query, query)
+                if cached_result:
+                    return cached_result
+                if not await run_in_threadpool(query_lock_held, key):
+                    break
+            # The holder failed or timed out — compute it ourselves
+            token = await run_in_threadpool(acquire_query_lock, key)
+
+    try:
+        return await compute()
+    finally:
+        if token:
+            await run_in_threadpool(release_query_lock, key, token)
+
+
+class BatchStatusRequest(BaseModel):
+    job_ids: List[str]
+
+
+@app.post("/status/batch")
+def check_status_batch(request: BatchStatusRequest):
+    # Status of many jobs from one SELECT instead of one /status call per file
+    return get_jobs(request.job_ids)
+
+
+@app.get("/batches/{batch_id}")
+def check_batch_status(batch_id: str):
+    jobs = get_batch_jobs(batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {"batch_id": batch_id, "jobs": jobs}
+
+
 @app.post("/query")
 @limiter.limit("10/minute")
-async def query_documents(request: Request, query: str):
+async def query_documents(request: Request, response: Response, query: str, debug: bool = False):
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
 
+    # Per-stage latencies go out in a Server-Timing header, and in the body with ?debug=true
+    timer = start_request_timer()
+
     # Check Redis cache first
-    cached_result = get_cached_query(query)
+    with request_stage("cache"):
+        result = await run_in_threadpool(get_cached_query, query)
+    if not result:
+        # Identical queries arriving together wait on a single embedding + Pinecone + GPT-4 run
+        result = await _single_flight(query, lambda: _answer_query(query))
+
+    timer.finish()
+    response.headers["Server-Timing"] = timer.server_timing()
+    if debug:
+        result = {**result, "timings": timer.as_dict()}
+    return result
+
+
+async def _answer_query(query):
+    # Re-checks the caches — another request may have finished while we waited for the lock
+    cached_result, query_embedding = await _lookup_cached_answer(query, "cache_recheck")
     if cached_result:
         return cached_result
 
     # Search for similar chunks
-    from pinecone_handler import search_similar_chunks
-    from openai_handler import generate_answer
+    from pinecone_handler import asearch_similar_chunks
+    from openai_handler import agenerate_answer
 
-    context_chunks = search_similar_chunks(query, top_k=5)
+    # Embedding, Pinecone and GPT-4 calls are all awaited, so other queries run while this one waits
+    with request_stage("retrieve"):
+        context_chunks = await asearch_similar_chunks(
+            query, top_k=5, query_embedding=query_embedding
+        )
 
     if not context_chunks:
         result = {
@@ -178,20 +335,131 @@ async def query_documents(request: Request, query: str):
             "answer": "No relevant documents found.",
             "sources": [],
         }
-        cache_query_result(query, result)
+        await _cache_answer(query, query_embedding, result)
         return result
 
     # Generate answer using GPT-4
-    answer = generate_answer(query, [c["text"] for c in context_chunks])
+    with request_stage("generate"):
+        answer = await agenerate_answer(query, [c["text"] for c in context_chunks])
 
     result = {"query": query, "answer": answer, "sources": context_chunks}
 
     # Cache the result
-    cache_query_result(query, result)
+    await _cache_answer(query, query_embedding, result)
 
     return result
 
 
+def _sse(event, data):
+    # One Server-Sent Events frame — data is JSON so newlines inside tokens can't break framing
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/query/stream")
+@limiter.limit("10/minute")
+async def query_documents_stream(request: Request, query: str):
+    # Same pipeline as /query, but sources are sent as soon as retrieval finishes and the
+    # answer follows token by token over SSE: sources -> token* -> done
+    # Only streams from a host that supports streaming responses (uvicorn, or a Lambda Function URL
+    # with response streaming). Behind API Gateway + Mangum the events arrive all at once at the end.
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    cached_result, query_embedding = await _lookup_cached_answer(query)
+
+    async def events():
+        if cached_result:
+            yield _sse("sources", cached_result["sources"])
+            yield _sse("token", cached_result["answer"])
+            yield _sse("done", cached_result)
+            return
+
+        from pinecone_handler import asearch_similar_chunks
+        from openai_handler import astream_answer
+
+        context_chunks = await asearch_similar_chunks(
+            query, top_k=5, query_embedding=query_embedding
+        )
+        yield _sse("sources", context_chunks)
+
+        if not context_chunks:
+            answer = "No relevant documents found."
+            yield _sse("token", answer)
+        else:
+            parts = []
+            async for token in astream_answer(query, [c["text"] for c in context_chunks]):
+                parts.append(token)
+                yield _sse("token", token)
+            answer = "".join(parts)
+
+        # Cache the assembled result so /query and later streams can reuse it
+        result = {"query": query, "answer": answer, "sources": context_chunks}
+        await _cache_answer(query, query_embedding, result)
+        yield _sse("done", result)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus scrape target: /query stage latency percentiles and cache hit counts.
+    # Ingest timings live in the SQS worker process, which exports them through INGEST_METRICS_PATH.
+    gauges = {f"query_cache_{name}": value for name, value in get_cache_stats().items()}
+    return PlainTextResponse(render_query_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/jobs/stream")
+async def stream_job_events(job_ids: str = None, batch_id: str = None):
+    # Push job status changes and chunk progress over SSE instead of having the client poll.
+    # Takes comma-separated job_ids or a batch_id from /presign-batch; ends once every job finished.
+    # Needs a host that streams responses (uvicorn, or a Lambda Function URL with response streaming).
+    # Behind API Gateway, Mangum buffers the body until the stream ends, so the frontend only uses
+    # this when REACT_APP_STREAM_URL points at such a host and polls /batches/{batch_id} otherwise.
+    if job_ids:
+        ids = [job_id for job_id in job_ids.split(",") if job_id]
+    elif batch_id:
+        ids = [job["job_id"] for job in await run_in_threadpool(get_batch_jobs, batch_id)]
+    else:
+        raise HTTPException(status_code=400, detail="Pass job_ids or batch_id")
+    if not ids:
+        raise HTTPException(status_code=404, detail="No jobs found")
+
+    async def events():
+        pubsub = async_redis_client.pubsub()
+        # Subscribe before reading current state so no transition falls in between
+        await pubsub.subscribe(*[job_channel(job_id) for job_id in ids])
+        try:
+            unfinished = set()
+            for job in await run_in_threadpool(get_jobs, ids):
+                yield _sse("job", job)
+                if job["status"] not in ("completed", "failed"):
+                    unfinished.add(job["job_id"])
+
+            while unfinished:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=15)
+                if message is None:
+                    # Comment frame keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                event = json.loads(message["data"])
+                yield _sse("job", event)
+                if event.get("status") in ("completed", "failed"):
+                    unfinished.discard(event["job_id"])
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Optional Prometheus textfile export — set to a path scraped by node_exporter's textfile collector
+INGEST_METRICS_PATH = os.getenv("INGEST_METRICS_PATH")
+
+# Process-wide totals across every job this container has handled, for the Prometheus export
+_ingest_totals = {}
+_ingest_totals_lock = threading.Lock()
+
+# Query latency percentiles are computed over the most recent samples per stage
+QUERY_METRICS_WINDOW = int(os.getenv("QUERY_METRICS_WINDOW", 1000))
+QUANTILES = (0.5, 0.95, 0.99)
+
+_query_samples = {}
+_query_totals = {}
+_query_lock = threading.Lock()
+_request_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class StageTimer:
+    # Per-job stage timings and counters (bytes, pages, chunks, vectors).
+    # Stages nest per thread: time spent in an inner stage is not counted again in the outer one,
+    # so lazily chained generators (extract -> chunk) still get separate numbers.
+    # Stages that run on pool threads (embed, upsert) add up their busy time across threads.
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds, **counters):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+            for key, value in counters.items():
+                stage[key] = stage.get(key, 0) + value
+
+    def _enter(self):
+        stack = self.local.__dict__.setdefault("stack", [])
+        frame = [time.perf_counter(), 0.0]  # start, time spent in nested stages
+        stack.append(frame)
+        return frame
+
+    def _exit(self, name, frame, counters):
+        elapsed = time.perf_counter() - frame[0]
+        stack = self.local.stack
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        self.add(name, elapsed - frame[1], **counters)
+
+    @contextmanager
+    def stage(self, name, **counters):
+        # Counters can also be filled in inside the block: `with timer.stage("x") as c: c["bytes"] = n`
+        frame = self._enter()
+        try:
+            yield counters
+        finally:
+            self._exit(name, frame, counters)
+
+    def timed_iter(self, name, items, counter=None):
+        # Times each step of a lazy iterator; counter names what one item counts as (pages, chunks)
+        iterator = iter(items)
+        while True:
+            frame = self._enter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(name, frame, {})
+                return
+            except BaseException:
+                self._exit(name, frame, {})
+                raise
+            self._exit(name, frame, {counter: 1} if counter else {})
+            yield item
+
+    def summary(self):
+        with self.lock:
+            stages = {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in stage.items()}
+                for name, stage in self.stages.items()
+            }
+        return {
+            "job_id": self.job_id,
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "stages": stages,
+        }
+
+    def finish(self):
+        # Emit one structured log line, fold into the process totals and return the summary
+        summary = self.summary()
+        print(json.dumps({"event": "ingest_timing", **summary}))
+        with _ingest_totals_lock:
+            for name, stage in self.stages.items():
+                totals = _ingest_totals.setdefault(name, {})
+                for key, value in stage.items():
+                    totals[key] = totals.get(key, 0) + value
+        if INGEST_METRICS_PATH:
+            # A sidecar file — failing to write it must not fail the job
+            try:
+                write_prometheus(INGEST_METRICS_PATH)
+            except Exception as e:
+                print(f"Ingest metrics write error: {e}")
+        return summary
+
+
+class RequestTimer:
+    # Stage timings for one API request, in the order they ran
+    def __init__(self):
+        self.stages = []
+        self.started = time.perf_counter()
+        self.total = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        with _query_lock:
+            for name, seconds in self.stages + [("total", self.total)]:
+                _query_samples.setdefault(name, deque(maxlen=QUERY_METRICS_WINDOW)).append(seconds)
+                count, total = _query_totals.get(name, (0, 0.0))
+                _query_totals[name] = (count + 1, total + seconds)
+
+    def server_timing(self):
+        # Server-Timing header value, shown per request in browser devtools
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+        if self.total is not None:
+            entries.append(f"total;dur={self.total * 1000:.1f}")
+        return ", ".join(entries)
+
+    def as_dict(self):
+        timings = {}
+        for name, seconds in self.stages:
+            timings[name] = round(timings.get(name, 0) + seconds * 1000, 1)
+        if self.total is not None:
+            timings["total"] = round(self.total * 1000, 1)
+        return {"unit": "ms", "stages": timings}
+
+
+def start_request_timer():
+    # Visible to everything awaited from the calling request, including threadpool calls
+    timer = RequestTimer()
+    _request_timer.set(timer)
+    return timer
+
+
+@contextmanager
+def request_stage(name):
+    # Times a block against the current request's timer; a no-op outside a timed request
+    timer = _request_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def _percentile(sorted_samples, q):
+    index = min(len(sorted_samples) - 1, max(0, round(q * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def query_percentiles():
+    # {stage: {"p50": ms, "p95": ms, "p99": ms, "count": n}} over the recent window
+    with _query_lock:
+        samples = {name: sorted(values) for name, values in _query_samples.items()}
+    return {
+        name: {
+            **{f"p{round(q * 100)}": round(_percentile(values, q) * 1000, 1) for q in QUANTILES},
+            "count": len(values),
+        }
+        for name, values in samples.items()
+    }
+
+
+def render_query_prometheus(gauges=None):
+    # Prometheus text exposition of the /query latency summaries, plus any extra gauges
+    with _query_lock:
+        samples = {name: sorted(values) for name, values in _query_samples.items()}
+        query_totals = dict(_query_totals)
+
+    lines = []
+    if samples:
+        lines.append("# TYPE rag_query_stage_seconds summary")
+    for name, values in sorted(samples.items()):
+        for q in QUANTILES:
+            lines.append(
+                f'rag_query_stage_seconds{{stage="{name}",quantile="{q}"}} {_percentile(values, q)}'
+            )
+        count, total = query_totals[name]
+        lines.append(f'rag_query_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f'rag_query_stage_seconds_sum{{stage="{name}"}} {total}')
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE rag_{name} gauge")
+        lines.append(f"rag_{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def render_prometheus():
+    # OpenMetrics/Prometheus text exposition of the ingest totals
+    with _ingest_totals_lock:
+        totals = {name: dict(stage) for name, stage in _ingest_totals.items()}
+
+    metrics = {}
+    for stage, values in sorted(totals.items()):
+        for key, value in sorted(values.items()):
+            metrics.setdefault(key, []).append((stage, value))
+
+    lines = []
+    for key, samples in metrics.items():
+        metric = f"rag_ingest_stage_{key}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f'{metric}{{stage="{stage}"}} {value}' for stage, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    # Write then rename so a scraper never reads a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(render_prometheus())
+    os.replace(tmp_path, path)
@@ -1,30 +1,146 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from embedding_cache import get_cached_embeddings, cache_embeddings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
 
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Used by the /query path so a request waiting on OpenAI doesn't block the event loop
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+CHAT_MODEL = "gpt-4"
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Requests are packed up to a token budget instead of a fixed item count (the API allows
+# 300k tokens and 2048 inputs per request), and several go out at once within the account's limits
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 100_000))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", 3000))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", 1_000_000))
+
+_encoding = tiktoken.get_encoding("cl100k_base") if tiktoken else None
+
+
+def count_tokens(text):
+    # Exact with tiktoken installed; otherwise a conservative ~3 chars per token estimate
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 3 + 1
+
+
+class _RateLimiter:
+    # Token bucket over requests and tokens per minute, shared by every thread in the process
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.requests = requests_per_minute
+        self.tokens = tokens_per_minute
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.updated
+                self.updated = now
+                self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+                self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                delay = max(
+                    (1 - self.requests) * 60 / self.rpm,
+                    (tokens - self.tokens) * 60 / self.tpm,
+                )
+            time.sleep(delay)
+
+
+embedding_limiter = _RateLimiter(EMBEDDING_RPM, EMBEDDING_TPM)
 
 
 def generate_embedding(text):
-    # Generate embedding vector for text
-    response = client.embeddings.create(model="text-embedding-3-small", input=text)
-    return response.data[0].embedding
+    # Generate embedding vector for text — repeated queries come from the embedding cache
+    cached = get_cached_embeddings(EMBEDDING_MODEL, [text])[0]
+    if cached is not None:
+        return cached
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    embedding = response.data[0].embedding
+    cache_embeddings(EMBEDDING_MODEL, [text], [embedding])
+    return embedding
 
 
-def generate_embeddings_batch(texts, batch_size=500):
-    all_embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
-        response = client.embeddings.create(model="text-embedding-3-small", input=batch)
-        all_embeddings.extend([item.embedding for item in response.data])
-    return all_embeddings
+async def agenerate_embedding(text):
+    # Async version of generate_embedding — the cache backends are sync, so they run in a thread
+    cached = (await asyncio.to_thread(get_cached_embeddings, EMBEDDING_MODEL, [text]))[0]
+    if cached is not None:
+        return cached
+    response = await async_client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    embedding = response.data[0].embedding
+    await asyncio.to_thread(cache_embeddings, EMBEDDING_MODEL, [text], [embedding])
+    return embedding
 
 
-def generate_answer(query, context_chunks):
-    
+def pack_batches(texts, max_items=500, max_tokens=EMBEDDING_BATCH_TOKENS):
+    # Group texts into (batch, token_count) pairs that fit both the item and token budget
+    batches = []
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append((batch, batch_tokens))
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append((batch, batch_tokens))
+    return batches
+
+
+def _embed_batch(batch, tokens):
+    embedding_limiter.acquire(tokens)
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+    return [item.embedding for item in response.data]
+
+
+def generate_embeddings_batch(texts, batch_size=500, concurrency=EMBEDDING_CONCURRENCY):
+    # Chunks that were embedded before (same model, same text) come from the cache —
+    # only the misses are sent to the API, packed by token count and sent concurrently
+    all_embeddings = get_cached_embeddings(EMBEDDING_MODEL, texts)
+    misses = list(dict.fromkeys(t for t, e in zip(texts, all_embeddings) if e is None))
+
+    batches = pack_batches(misses, max_items=batch_size)
+    if len(batches) > 1 and concurrency > 1:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            results = list(pool.map(lambda b: _embed_batch(*b), batches))
+    else:
+        results = [_embed_batch(*b) for b in batches]
+
+    fresh = {}
+    for (batch, _), embeddings in zip(batches, results):
+        fresh.update(zip(batch, embeddings))
+
+    if fresh:
+        cache_embeddings(EMBEDDING_MODEL, list(fresh), list(fresh.values()))
+
+    return [e if e is not None else fresh[t] for t, e in zip(texts, all_embeddings)]
+
+
+def _build_messages(query, context_chunks):
     context = "\n\n".join(context_chunks)
 
     prompt = f"""Answer the question based on the context below. If the answer is not in the context, say "I cannot answer based on the provided documents."
@@ -36,17 +152,47 @@ Question: {query}
 
 Answer:"""
 
+    return [
+        {
+            "role": "system",
+            "content": "You are a helpful assistant that answers questions based on provided documents.",
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def generate_answer(query, context_chunks):
     response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that answers questions based on provided documents.",
-            },
-            {"role": "user", "content": prompt},
-        ],
+        model=CHAT_MODEL,
+        messages=_build_messages(query, context_chunks),
         temperature=0.7,
         max_tokens=500,
     )
 
     return response.choices[0].message.content
+
+
+async def agenerate_answer(query, context_chunks):
+    # Async version of generate_answer
+    response = await async_client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_build_messages(query, context_chunks),
+        temperature=0.7,
+        max_tokens=500,
+    )
+
+    return response.choices[0].message.content
+
+
+async def astream_answer(query, context_chunks):
+    # Yields answer tokens as GPT-4 produces them instead of waiting for the full completion
+    stream = await async_client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=_build_messages(query, context_chunks),
+        temperature=0.7,
+        max_tokens=500,
+        stream=True,
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
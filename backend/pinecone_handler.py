@@ -1,19 +1,47 @@
 from pinecone import Pinecone, ServerlessSpec
 import os
-from openai_handler import generate_embedding, generate_embeddings_batch
+import httpx
+import asyncio
+import json
+import time
+import hashlib
+from array import array
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from openai_handler import generate_embedding, generate_embeddings_batch, agenerate_embedding
+from redis_handler import get_cached_retrieval, cache_retrieval
+
+# "pinecone" (serverless index) or "local" (in-process index, see local_index.py) — local suits
+# single-machine deployments and tests; it needs no Pinecone account
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
 
 # Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY")) if VECTOR_BACKEND == "pinecone" else None
 
 INDEX_NAME = "rag-documents"
+EMBEDDING_DIMENSION = 1536  # OpenAI embedding size
+PINECONE_API_VERSION = "2025-10"
+
+# Pinecone caps upserts at 1000 vectors and 2MB per request — stay under both with some headroom
+UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", 100))
+UPSERT_BATCH_BYTES = int(os.getenv("PINECONE_UPSERT_BATCH_BYTES", 1_500_000))
+UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", 4))
+UPSERT_RETRIES = int(os.getenv("PINECONE_UPSERT_RETRIES", 3))
+# Embedding batches in flight at once during ingest — also bounds how many chunk batches sit in memory
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", 4))
 
 
 def create_index_if_not_exists():
+    if VECTOR_BACKEND == "local":
+        from local_index import get_local_index
+
+        return get_local_index(EMBEDDING_DIMENSION)
+
     # Check if index exists
     if INDEX_NAME not in pc.list_indexes().names():
         pc.create_index(
             name=INDEX_NAME,
-            dimension=1536,  # OpenAI embedding size
+            dimension=EMBEDDING_DIMENSION,
             metric="cosine",
             spec=ServerlessSpec(
                 cloud="aws", region=os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
@@ -22,16 +50,207 @@ def create_index_if_not_exists():
     return pc.Index(INDEX_NAME)
 
 
-def store_chunks(chunks, filename):
+def store_chunks(
+    chunks, filename, batch_size=100, incremental=False, on_progress=None, timer=None
+):
     # Store document chunks in Pinecone with embeddings
+    # chunks can be a list or a generator (e.g. document_processor.chunk_pages). Ingest is a
+    # two-stage pipeline: each batch of chunks is embedded on one pool, and as soon as its
+    # embeddings return its vectors go to the upsert pool — so parsing, embedding and upserting
+    # overlap and wall-clock time tends to the slowest stage rather than the sum.
+    # incremental=True diffs against the vectors already stored for this filename: unchanged chunks
+    # are skipped, moved chunks reuse their stored vector, and ids past the new end are deleted
+    # Vectors are written in place under <filename>_<i>, so callers must release the dedup records
+    # pointing at filename first (documents.release_filename)
+    # on_progress(chunks_embedded=..., vectors_upserted=...) is called from this thread as work completes
+    # timer (metrics.StageTimer) receives embed/upsert stage timings when given
     index = create_index_if_not_exists()
+    existing = None
+    if incremental:
+        with _stage(timer, "load_existing") as counters:
+            existing = _load_existing_chunks(index, filename)
+            counters["vectors"] = len(existing["indexes"])
+
+    count = 0
+    chunks_embedded = 0
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as embed_pool, ThreadPoolExecutor(
+        max_workers=UPSERT_CONCURRENCY
+    ) as upsert_pool:
+        embedding = {}  # future -> number of chunks in its batch
+        upserting = {}  # future -> number of vectors in its batch
+
+        def report():
+            if on_progress:
+                vectors_upserted = sum(n for f, n in upserting.items() if f.done())
+                on_progress(chunks_embedded=chunks_embedded, vectors_upserted=vectors_upserted)
+
+        def hand_off(block):
+            # Move finished embedding batches to the upsert stage
+            nonlocal chunks_embedded
+            if block:
+                done, _ = wait(embedding, return_when=FIRST_COMPLETED)
+            else:
+                done = {f for f in embedding if f.done()}
+            for future in done:
+                chunks_embedded += embedding.pop(future)
+                for batch in split_vectors(future.result()):
+                    upsert = upsert_pool.submit(
+                        _upsert_batch, index, len(upserting), batch, UPSERT_RETRIES
+                    )
+                    if timer:
+                        upsert.add_done_callback(lambda f: _record_upsert(timer, f))
+                    upserting[upsert] = len(batch)
+            # Backpressure — don't let upserts fall arbitrarily far behind the embedding stage
+            while sum(not f.done() for f in upserting) > 2 * UPSERT_CONCURRENCY:
+                wait([f for f in upserting if not f.done()], return_when=FIRST_COMPLETED)
+            if done:
+                report()
+
+        for batch in _batched(chunks, batch_size):
+            future = embed_pool.submit(_prepare_vectors, batch, filename, count, existing, timer)
+            embedding[future] = len(batch)
+            count += len(batch)
+            hand_off(block=len(embedding) >= EMBED_CONCURRENCY)
+
+        while embedding:
+            hand_off(block=True)
+        for future in upserting:
+            future.result()
+        report()
+
+    if existing:
+        stale_ids = [vector_id for vector_id, i in existing["indexes"].items() if i >= count]
+        with _stage(timer, "delete_stale", vectors=len(stale_ids)):
+            _delete_ids(index, stale_ids)
+
+    # The local backend saves to disk once per document rather than on every upsert batch
+    if hasattr(index, "persist"):
+        index.persist()
+
+    return count
+
+
+def _stage(timer, name, **counters):
+    return timer.stage(name, **counters) if timer else nullcontext(counters)
+
+
+def _record_upsert(timer, future):
+    if not future.exception():
+        stats = future.result()
+        timer.add("upsert", stats["ms"] / 1000, vectors=stats["vectors"])
+
+
+def _batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _load_existing_chunks(index, filename, fetch_batch_size=100):
+    # Everything stored for this document: id -> chunk index, id -> text hash, text hash -> vector.
+    # Vectors are kept as float32 arrays so a large document's state stays small in memory.
+    prefix = f"{filename}_"
+    existing = {"indexes": {}, "hashes": {}, "vectors": {}}
+
+    ids = _document_ids(index, filename)
+    for i in range(0, len(ids), fetch_batch_size):
+        fetched = index.fetch(ids=ids[i : i + fetch_batch_size])
+        for vector_id, vector in fetched.vectors.items():
+            text_hash = _text_hash(vector.metadata["text"])
+            existing["indexes"][vector_id] = int(vector_id[len(prefix) :])
+            existing["hashes"][vector_id] = text_hash
+            existing["vectors"][text_hash] = array("f", vector.values)
+
+    return existing
+
+
+def _document_ids(index, filename):
+    prefix = f"{filename}_"
+    ids = []
+    for page in index.list(prefix=prefix):
+        # The prefix also matches other files like "<filename>_v2.pdf_0" — keep only our own ids
+        ids.extend(i for i in page if i[len(prefix) :].isdigit())
+    return ids
+
+
+def copy_document_vectors(source, target, fetch_batch_size=100):
+    # Store source's chunks again under target's ids, reusing the stored embeddings — used when an
+    # upload deduplicated onto source has to keep its chunks after source is overwritten
+    index = create_index_if_not_exists()
+    ids = _document_ids(index, source)
+    prefix = f"{source}_"
+    for i in range(0, len(ids), fetch_batch_size):
+        fetched = index.fetch(ids=ids[i : i + fetch_batch_size])
+        vectors = [
+            {
+                "id": f"{target}_{vector_id[len(prefix) :]}",
+                "values": list(vector.values),
+                "metadata": {**vector.metadata, "filename": target},
+            }
+            for vector_id, vector in fetched.vectors.items()
+        ]
+        for batch_number, batch in enumerate(split_vectors(vectors)):
+            _upsert_batch(index, batch_number, batch, UPSERT_RETRIES)
+    if hasattr(index, "persist"):
+        index.persist()
+    return len(ids)
+
+
+def delete_document_vectors(filename):
+    # Remove every chunk stored for filename; returns how many were deleted
+    index = create_index_if_not_exists()
+    ids = _document_ids(index, filename)
+    _delete_ids(index, ids)
+    if ids and hasattr(index, "persist"):
+        index.persist()
+    return len(ids)
+
 
-    # Generate all embeddings in one batched API call instead of one per chunk
-    embeddings = generate_embeddings_batch(chunks)
+def _delete_ids(index, ids, batch_size=1000):
+    # Pinecone accepts at most 1000 ids per delete call
+    for i in range(0, len(ids), batch_size):
+        index.delete(ids=ids[i : i + batch_size])
+
+
+def _prepare_vectors(chunks, filename, start_index, existing=None, timer=None):
+    # Embedding stage — returns the vectors that need writing for this batch
+    ids = [f"{filename}_{i}" for i in range(start_index, start_index + len(chunks))]
+    embeddings = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+    unchanged = set()
+
+    if existing:
+        pending = []
+        for j, chunk in enumerate(chunks):
+            text_hash = _text_hash(chunk)
+            if existing["hashes"].get(ids[j]) == text_hash:
+                unchanged.add(j)  # already stored under the same id — nothing to write
+            elif text_hash in existing["vectors"]:
+                embeddings[j] = existing["vectors"][text_hash].tolist()
+            else:
+                pending.append(j)
+
+    # Generate all embeddings for the batch in one API call instead of one per chunk
+    if pending:
+        with _stage(timer, "embed", chunks=len(pending)):
+            fresh = generate_embeddings_batch([chunks[j] for j in pending])
+        for j, embedding in zip(pending, fresh):
+            embeddings[j] = embedding
 
     vectors = []
-    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        vector_id = f"{filename}_{i}"
+    for j, (vector_id, chunk, embedding) in enumerate(zip(ids, chunks, embeddings)):
+        if j in unchanged:
+            continue
+        i = start_index + j
         vectors.append(
             {
                 "id": vector_id,
@@ -40,30 +259,132 @@ def store_chunks(chunks, filename):
             }
         )
 
-    # Upload to Pinecone in batches
-    if vectors:
-        index.upsert(vectors=vectors)
+    return vectors
 
-    return len(vectors)
 
+def split_vectors(vectors, max_count=UPSERT_BATCH_SIZE, max_bytes=UPSERT_BATCH_BYTES):
+    # Group vectors into request-sized batches by count and by serialized size —
+    # metadata carries the full chunk text, so byte size varies a lot between documents
+    batches = []
+    batch, batch_bytes = [], 0
+    for vector in vectors:
+        size = len(json.dumps(vector))
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
 
-def search_similar_chunks(query, top_k=3):
-    # Search for similar chunks using query embedding
-    index = create_index_if_not_exists()
 
-    # Generate embedding for query
-    query_embedding = generate_embedding(query)
+def _upsert_batch(index, batch_number, batch, retries):
+    start = time.perf_counter()
+    for attempt in range(retries + 1):
+        try:
+            index.upsert(vectors=batch)
+            break
+        except Exception as e:
+            # 4xx other than rate limiting won't succeed on retry
+            status = getattr(e, "status", None)
+            if attempt == retries or (status and 400 <= status < 500 and status != 429):
+                raise
+            print(f"Pinecone upsert batch {batch_number} failed (attempt {attempt + 1}): {e}")
+            time.sleep(0.5 * 2**attempt)
+
+    # Timings go to the caller's StageTimer, not the log — one line per batch floods it on large files
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {"batch": batch_number, "vectors": len(batch), "attempts": attempt + 1, "ms": elapsed_ms}
 
-    # Search Pinecone
-    results = index.query(vector=query_embedding, top_k=top_k, include_metadata=True)
 
+def _format_matches(matches):
     # Return text alongside source metadata so callers know which doc each chunk came from
-    chunks = [
+    return [
         {
             "text": match["metadata"]["text"],
             "filename": match["metadata"]["filename"],
             "chunk_index": match["metadata"]["chunk_index"],
         }
-        for match in results["matches"]
+        for match in matches
     ]
+
+
+def search_similar_chunks(query, top_k=3, query_embedding=None):
+    # Search for similar chunks using query embedding
+    # Generate embedding for query, unless the caller already has one
+    if query_embedding is None:
+        query_embedding = generate_embedding(query)
+
+    # Same vector against the same corpus version returns the same chunks — skip the round trip
+    chunks = get_cached_retrieval(query_embedding, top_k)
+    if chunks is not None:
+        return chunks
+
+    # Search Pinecone
+    index = create_index_if_not_exists()
+    results = index.query(vector=query_embedding, top_k=top_k, include_metadata=True)
+
+    chunks = _format_matches(results["matches"])
+    cache_retrieval(query_embedding, top_k, chunks)
+    return chunks
+
+
+_index_host = None
+_async_http = None
+
+
+def _get_index_host():
+    # Data-plane host of the index — looked up once per container
+    global _index_host
+    if _index_host is None:
+        create_index_if_not_exists()
+        _index_host = pc.describe_index(INDEX_NAME).host
+    return _index_host
+
+
+def _get_async_http():
+    # One pooled HTTP/1.1 client per process so concurrent queries reuse TLS connections
+    global _async_http
+    if _async_http is None:
+        _async_http = httpx.AsyncClient(
+            timeout=30, limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    return _async_http
+
+
+async def asearch_similar_chunks(query, top_k=3, query_embedding=None):
+    # Async version of search_similar_chunks — talks to the index's REST API directly with httpx,
+    # since the sync Pinecone client would block the event loop for the whole round trip
+    if query_embedding is None:
+        query_embedding = await agenerate_embedding(query)
+
+    chunks = await asyncio.to_thread(get_cached_retrieval, query_embedding, top_k)
+    if chunks is not None:
+        return chunks
+
+    if VECTOR_BACKEND == "local":
+        # No network hop — the search is CPU work, so keep it off the event loop
+        index = create_index_if_not_exists()
+        results = await asyncio.to_thread(
+            index.query, vector=query_embedding, top_k=top_k, include_metadata=True
+        )
+        chunks = _format_matches(results["matches"])
+        await asyncio.to_thread(cache_retrieval, query_embedding, top_k, chunks)
+        return chunks
+
+    host = _index_host or await asyncio.to_thread(_get_index_host)
+
+    response = await _get_async_http().post(
+        f"https://{host}/query",
+        headers={
+            "Api-Key": os.getenv("PINECONE_API_KEY"),
+            "X-Pinecone-API-Version": PINECONE_API_VERSION,
+        },
+        json={"vector": query_embedding, "topK": top_k, "includeMetadata": True},
+    )
+    response.raise_for_status()
+
+    chunks = _format_matches(response.json()["matches"])
+    await asyncio.to_thread(cache_retrieval, query_embedding, top_k, chunks)
     return chunks
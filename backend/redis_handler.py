@@ -1,7 +1,16 @@
 import redis
+import redis.asyncio
 import json
+import time
+import base64
 import hashlib
+import threading
+import unicodedata
 import os
+import uuid
+from array import array
+from collections import OrderedDict
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,24 +25,355 @@ redis_client = redis.Redis(
     socket_connect_timeout=5,
 )
 
+# Async client for long-lived subscriptions (the /jobs/stream endpoint) — a sync pub/sub
+# listener would tie up a threadpool worker for the whole stream
+async_redis_client = redis.asyncio.Redis(
+    host=os.getenv("REDIS_HOST"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    password=os.getenv("REDIS_PASSWORD"),
+    ssl=True,
+    decode_responses=True,
+    socket_connect_timeout=5,
+)
+
+
+# Cached answers are keyed by corpus generation, so ingesting a document retires them all at once
+# and they can live much longer than an hour without going stale
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", 7 * 24 * 3600))
+CORPUS_VERSION_KEY = "corpus:generation"
+# How long a process trusts its last read of the generation — bounds staleness after an ingest
+CORPUS_VERSION_REFRESH_SECONDS = float(os.getenv("CORPUS_VERSION_REFRESH_SECONDS", 5))
+
+_corpus_version = {"value": "0", "checked_at": 0.0}
+
+
+def normalize_query(query):
+    # Case, Unicode form, whitespace and trailing punctuation don't change the answer
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(query.split()).rstrip("?!. ")
+
+
+def get_corpus_version():
+    now = time.time()
+    if now - _corpus_version["checked_at"] >= CORPUS_VERSION_REFRESH_SECONDS:
+        try:
+            _corpus_version["value"] = redis_client.get(CORPUS_VERSION_KEY) or "0"
+            _corpus_version["checked_at"] = now
+        except Exception as e:
+            print(f"Redis corpus version error: {e}")
+    return _corpus_version["value"]
+
+
+def bump_corpus_version():
+    # Called after documents are (re)indexed — every cached answer becomes unreachable
+    try:
+        _corpus_version["value"] = str(redis_client.incr(CORPUS_VERSION_KEY))
+        _corpus_version["checked_at"] = time.time()
+    except Exception as e:
+        print(f"Redis corpus version error: {e}")
+        return False
+    return invalidate_semantic_cache()
+
+
+def query_cache_key(query):
+    digest = hashlib.md5(normalize_query(query).encode()).hexdigest()
+    return f"query:{get_corpus_version()}:{digest}"
+
+
+class LocalLRUCache:
+    # In-process tier in front of Redis — a warm container answers popular questions from memory
+    # without the TLS round trip. Holds serialized JSON so callers can't mutate a shared entry.
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+local_cache = LocalLRUCache(
+    max_entries=int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", 1000)),
+    ttl=float(os.getenv("LOCAL_CACHE_TTL", 300)),
+)
+cache_stats = {"memory_hits": 0, "memory_misses": 0, "redis_hits": 0, "redis_misses": 0}
+# Lookups run on threadpool threads — without the lock concurrent increments get lost
+_cache_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _cache_stats_lock:
+        cache_stats[stat] += 1
+
+
+def get_cache_stats():
+    with _cache_stats_lock:
+        stats = dict(cache_stats)
+    return dict(stats, memory_entries=len(local_cache.entries))
+
 
 def get_cached_query(query):
     try:
-        cache_key = f"query:{hashlib.md5(query.encode()).hexdigest()}"
+        cache_key = query_cache_key(query)
+        cached = local_cache.get(cache_key)
+        if cached:
+            _count("memory_hits")
+            return json.loads(cached)
+        _count("memory_misses")
+
         cached = redis_client.get(cache_key)
         if cached:
+            _count("redis_hits")
+            local_cache.set(cache_key, cached)
             return json.loads(cached)
+        _count("redis_misses")
         return None
     except Exception as e:
         print(f"Redis get error: {e}")
         return None
 
 
-def cache_query_result(query, result, ttl=3600):
+def cache_query_result(query, result, ttl=QUERY_CACHE_TTL):
     try:
-        cache_key = f"query:{hashlib.md5(query.encode()).hexdigest()}"
-        redis_client.setex(cache_key, ttl, json.dumps(result))
+        cache_key = query_cache_key(query)
+        value = json.dumps(result)
+        local_cache.set(cache_key, value, ttl)
+        redis_client.setex(cache_key, ttl, value)
         return True
     except Exception as e:
         print(f"Redis set error: {e}")
         return False
+
+
+def retrieval_cache_key(query_embedding, top_k):
+    # Retrieval depends only on the query vector, top_k and the indexed corpus
+    digest = hashlib.sha256(array("f", query_embedding).tobytes()).hexdigest()
+    return f"retrieval:{get_corpus_version()}:{top_k}:{digest}"
+
+
+def get_cached_retrieval(query_embedding, top_k):
+    # Cached search_similar_chunks results — lets a new prompt or model rerun only generation
+    try:
+        cache_key = retrieval_cache_key(query_embedding, top_k)
+        cached = local_cache.get(cache_key) or redis_client.get(cache_key)
+        if cached:
+            local_cache.set(cache_key, cached)
+            return json.loads(cached)
+        return None
+    except Exception as e:
+        print(f"Redis retrieval get error: {e}")
+        return None
+
+
+def cache_retrieval(query_embedding, top_k, chunks, ttl=QUERY_CACHE_TTL):
+    try:
+        cache_key = retrieval_cache_key(query_embedding, top_k)
+        value = json.dumps(chunks)
+        local_cache.set(cache_key, value, ttl)
+        redis_client.setex(cache_key, ttl, value)
+        return True
+    except Exception as e:
+        print(f"Redis retrieval set error: {e}")
+        return False
+
+
+def job_channel(job_id):
+    return f"jobs:{job_id}"
+
+
+def publish_job_event(job_id, **fields):
+    # Fire-and-forget — progress pushes must never fail the job itself
+    try:
+        redis_client.publish(job_channel(job_id), json.dumps({"job_id": job_id, **fields}, default=str))
+        return True
+    except Exception as e:
+        print(f"Redis publish error: {e}")
+        return False
+
+
+# Short-lived per-query lock so only one instance computes an uncached answer at a time
+QUERY_LOCK_TTL = float(os.getenv("QUERY_LOCK_TTL", 30))
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+# The lock functions take the answer's query_cache_key, computed once by the caller — recomputing it
+# per call could land on a newer corpus generation mid-request and release a different key
+def acquire_query_lock(cache_key, ttl=QUERY_LOCK_TTL):
+    # Returns a token if this caller should compute the answer, None if another instance holds it.
+    # If Redis is unreachable we can't coordinate — let the caller compute rather than wait.
+    token = uuid.uuid4().hex
+    try:
+        if redis_client.set(f"lock:{cache_key}", token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+    except Exception as e:
+        print(f"Redis lock error: {e}")
+        return token
+
+
+def query_lock_held(cache_key):
+    try:
+        return bool(redis_client.exists(f"lock:{cache_key}"))
+    except Exception as e:
+        print(f"Redis lock error: {e}")
+        return False
+
+
+def release_query_lock(cache_key, token):
+    # Only delete the lock if it is still ours — it may have expired and been taken by someone else
+    try:
+        redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{cache_key}", token)
+        return True
+    except Exception as e:
+        print(f"Redis lock release error: {e}")
+        return False
+
+
+# Semantic cache — answers for past queries whose embedding is close enough to the new one.
+# Entry vectors live in a Redis hash shared by every instance; each process keeps a local float32
+# matrix of them. A refresh reads only the index's ids and scores and fetches vectors for the
+# entries it hasn't seen, so a write on one instance doesn't make every other one re-download the hash.
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 500))
+SEMANTIC_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+SEMANTIC_REFRESH_SECONDS = float(os.getenv("SEMANTIC_CACHE_REFRESH_SECONDS", 5))
+
+SEMANTIC_VECTORS_KEY = "semcache:vectors"
+SEMANTIC_INDEX_KEY = "semcache:index"
+
+_semantic_lock = threading.Lock()
+# ids[i] is the entry in row i of matrix; scores holds each entry's write time to spot rewrites
+_semantic_local = {"checked_at": 0.0, "ids": [], "scores": {}, "matrix": None}
+
+
+def _semantic_vectors():
+    # (entry ids, matrix) of the shared entries, refreshed at most every SEMANTIC_REFRESH_SECONDS
+    with _semantic_lock:
+        now = time.time()
+        if now - _semantic_local["checked_at"] < SEMANTIC_REFRESH_SECONDS:
+            return _semantic_local["ids"], _semantic_local["matrix"]
+        _semantic_local["checked_at"] = now
+
+        current = dict(redis_client.zrange(SEMANTIC_INDEX_KEY, 0, -1, withscores=True))
+        known = _semantic_local["scores"]
+        rows = {entry_id: i for i, entry_id in enumerate(_semantic_local["ids"])}
+        # Evicted and invalidated entries drop out; new or rewritten ones are fetched
+        keep = [e for e in _semantic_local["ids"] if e in current and current[e] == known.get(e)]
+        fetch = [e for e in current if e not in keep]
+
+        vectors = [_semantic_local["matrix"][rows[e]] for e in keep]
+        ids = list(keep)
+        if fetch:
+            for entry_id, value in zip(fetch, redis_client.hmget(SEMANTIC_VECTORS_KEY, fetch)):
+                if value:
+                    ids.append(entry_id)
+                    vectors.append(np.frombuffer(base64.b64decode(value), dtype=np.float32))
+
+        _semantic_local["ids"] = ids
+        _semantic_local["scores"] = {e: current[e] for e in ids}
+        _semantic_local["matrix"] = np.stack(vectors) if vectors else None
+        return ids, _semantic_local["matrix"]
+
+
+def get_semantic_cached_query(query_embedding, threshold=None):
+    # OpenAI embeddings are unit length, so the dot product is the cosine similarity —
+    # one matrix-vector product scores every entry
+    threshold = SEMANTIC_THRESHOLD if threshold is None else threshold
+    try:
+        ids, matrix = _semantic_vectors()
+        if matrix is None:
+            return None
+        scores = matrix @ np.asarray(query_embedding, dtype=np.float32)
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        best_id = ids[best]
+
+        cached = redis_client.get(f"semcache:result:{best_id}")
+        if not cached:
+            return None
+        # Entries from before the last ingest may still be in the local copy — ignore them
+        entry = json.loads(cached)
+        if entry["generation"] != get_corpus_version():
+            return None
+        return entry["result"]
+    except Exception as e:
+        print(f"Redis semantic get error: {e}")
+        return None
+
+
+def cache_semantic_query(query, query_embedding, result, ttl=None):
+    ttl = SEMANTIC_TTL if ttl is None else ttl
+    try:
+        entry_id = hashlib.md5(normalize_query(query).encode()).hexdigest()
+        entry = {"generation": get_corpus_version(), "result": result}
+        now = time.time()
+
+        pipe = redis_client.pipeline()
+        pipe.setex(f"semcache:result:{entry_id}", ttl, json.dumps(entry))
+        pipe.hset(
+            SEMANTIC_VECTORS_KEY,
+            entry_id,
+            base64.b64encode(array("f", query_embedding).tobytes()).decode(),
+        )
+        pipe.zadd(SEMANTIC_INDEX_KEY, {entry_id: now})
+        pipe.zrangebyscore(SEMANTIC_INDEX_KEY, 0, now - ttl)
+        pipe.zcard(SEMANTIC_INDEX_KEY)
+        expired, size = pipe.execute()[-2:]
+
+        # Drop entries past their TTL, then the oldest ones beyond the size bound
+        evicted = list(expired)
+        if size - len(evicted) > SEMANTIC_MAX_ENTRIES:
+            oldest = redis_client.zrange(
+                SEMANTIC_INDEX_KEY, len(evicted), size - SEMANTIC_MAX_ENTRIES - 1
+            )
+            evicted.extend(oldest)
+
+        if evicted:
+            pipe = redis_client.pipeline()
+            pipe.zrem(SEMANTIC_INDEX_KEY, *evicted)
+            pipe.hdel(SEMANTIC_VECTORS_KEY, *evicted)
+            pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis semantic set error: {e}")
+        return False
+
+
+def invalidate_semantic_cache():
+    # Called when the indexed documents change — cached answers may no longer be right
+    try:
+        entry_ids = redis_client.zrange(SEMANTIC_INDEX_KEY, 0, -1)
+        pipe = redis_client.pipeline()
+        if entry_ids:
+            pipe.delete(*[f"semcache:result:{entry_id}" for entry_id in entry_ids])
+        pipe.delete(SEMANTIC_VECTORS_KEY, SEMANTIC_INDEX_KEY)
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"Redis semantic invalidate error: {e}")
+        return False
@@ -1,14 +1,26 @@
 import json
 import os
 from dotenv import load_dotenv
-from document_processor import extract_text_from_pdf, chunk_text
+from document_processor import iter_pdf_pages, chunk_pages, hash_file
 from pinecone_handler import store_chunks
 from s3_handler import download_from_s3
-from db_handler import update_job
+from redis_handler import bump_corpus_version
+from db_handler import get_document_by_hash, create_document, add_document_alias
+from documents import release_filename
+from job_events import update_job_status, JobProgress
+from metrics import StageTimer
 
 load_dotenv()
 
 
+def _track_pages(pages, progress):
+    # Pass pages through to the chunker while counting them
+    for page_number, text in pages:
+        progress.update(pages_extracted=page_number)
+        yield page_number, text
+    progress.stage("extracted")
+
+
 def handler(event, context):
     # Lambda entry point — SQS triggers this with a batch of records
     failed = []
@@ -21,25 +33,74 @@ def handler(event, context):
 
         local_path = f"/tmp/{job_id}.pdf"
 
+        progress = JobProgress(job_id)
+        # Where the time went: one structured log line per job, also saved on the job row
+        timer = StageTimer(job_id)
+
         try:
-            update_job(job_id, status="processing")
+            progress.stage("started", status="processing")
+
+            with timer.stage("download") as counters:
+                success = download_from_s3(s3_key, local_path)
+                if not success:
+                    raise Exception("S3 download failed")
+                counters["bytes"] = os.path.getsize(local_path)
+            progress.stage("downloaded")
 
-            success = download_from_s3(s3_key, local_path)
-            if not success:
-                raise Exception("S3 download failed")
+            # Identical bytes were already indexed (same file, maybe under another name) —
+            # skip extraction and embedding and just point this filename at the existing document
+            with timer.stage("hash"):
+                content_hash = hash_file(local_path)
+            existing = get_document_by_hash(content_hash)
+            if existing:
+                if filename != existing["filename"] and filename not in existing["aliases"]:
+                    # filename may still hold chunks of different content — they must not stay
+                    # searchable under a name that now means this document
+                    if release_filename(filename, delete_vectors=True):
+                        bump_corpus_version()
+                add_document_alias(content_hash, filename)
+                progress.stage(
+                    "completed",
+                    status="completed",
+                    chunks_created=existing["chunks_created"],
+                    content_hash=content_hash,
+                    timings=json.dumps(timer.finish()),
+                )
+                continue
 
-            text = extract_text_from_pdf(local_path)
-            chunks = chunk_text(text)
+            # This filename's vectors are about to be overwritten — hand them to any upload aliased
+            # onto it, and stop the old content satisfying a dedup lookup
+            release_filename(filename)
 
-            # Embeds all chunks in batches and upserts into Pinecone
-            chunks_created = store_chunks(chunks, filename)
+            # Pages are parsed lazily — store_chunks embeds and upserts each batch of chunks
+            # as soon as it is ready, so only a few pages are ever held in memory.
+            # Incremental mode only rewrites chunks that changed since a previous upload of this filename.
+            pages = timer.timed_iter("extract", iter_pdf_pages(local_path), "pages")
+            chunks = timer.timed_iter("chunk", chunk_pages(_track_pages(pages, progress)), "chunks")
+            # "index" is time the ingest thread spent waiting on the embed/upsert pools
+            with timer.stage("index"):
+                chunks_created = store_chunks(
+                    chunks, filename, incremental=True, on_progress=progress.update, timer=timer
+                )
+            progress.stage("indexed")
+            # Answers cached against the old corpus may now be wrong — retire them
+            bump_corpus_version()
 
-            update_job(job_id, status="completed", chunks_created=chunks_created)
+            create_document(content_hash, filename, chunks_created)
+            progress.stage(
+                "completed",
+                status="completed",
+                chunks_created=chunks_created,
+                content_hash=content_hash,
+                timings=json.dumps(timer.finish()),
+            )
 
         except Exception as e:
-            update_job(job_id, status="failed", error=str(e))
             # Report only this message as failed — SQS retries it without reprocessing the rest of the batch
             failed.append({"itemIdentifier": record["messageId"]})
+            update_job_status(
+                job_id, status="failed", error=str(e), timings=json.dumps(timer.finish())
+            )
 
         finally:
             if os.path.exists(local_path):
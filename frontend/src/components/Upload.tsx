@@ -2,6 +2,9 @@ import { useState } from "react";
 import axios from "axios";
 
 const API_URL = "https://e30fd4du98.execute-api.us-east-1.amazonaws.com";
+// Server that can stream responses (uvicorn, or a Lambda Function URL with response streaming).
+// API Gateway + Mangum buffers the whole body, so without this the upload status is polled instead.
+const STREAM_URL = process.env.REACT_APP_STREAM_URL;
 
 interface JobStatus {
   job_id: string;
@@ -41,27 +44,57 @@ export default function Upload() {
             headers: { "Content-Type": "application/pdf" },
           });
           await axios.post(`${API_URL}/confirm?job_id=${r.job_id}&s3_key=${r.s3_key}`);
-          pollStatus(r.job_id);
         })
       );
+      if (STREAM_URL) {
+        watchBatch(presignRes.data[0].batch_id);
+      } else {
+        pollBatchStatus(presignRes.data[0].batch_id);
+      }
     } catch (err) {
       setLoading(false);
     }
   };
 
-  const pollStatus = (job_id: string) => {
-    // Poll every 2s until job completes or fails
+  const watchBatch = (batch_id: string) => {
+    // Status changes are pushed over SSE; fall back to polling if the stream drops early
+    const source = new EventSource(`${STREAM_URL}/jobs/stream?batch_id=${batch_id}`);
+    const statuses: Record<string, string> = {};
+    source.addEventListener("job", (e) => {
+      const job = JSON.parse((e as MessageEvent).data);
+      statuses[job.job_id] = job.status;
+      setJobs((prev) =>
+        prev.map((j) => (j.job_id === job.job_id ? { ...j, status: job.status } : j))
+      );
+    });
+    source.onerror = () => {
+      // The server also ends the stream this way once every job has finished
+      source.close();
+      const finished =
+        Object.keys(statuses).length > 0 &&
+        Object.values(statuses).every((s) => s === "completed" || s === "failed");
+      if (finished) {
+        setLoading(false);
+      } else {
+        pollBatchStatus(batch_id);
+      }
+    };
+  };
+
+  const pollBatchStatus = (batch_id: string) => {
+    // One request every 2s for the whole upload until every job completes or fails
     const interval = setInterval(async () => {
-      const res = await axios.get(`${API_URL}/status/${job_id}`);
-      setJobs((prev) => {
-        const updated = prev.map((j) => (j.job_id === job_id ? { ...j, status: res.data.status } : j));
-        // Only stop loading when every job has finished
-        if (updated.every((j) => j.status === "completed" || j.status === "failed")) {
-          setLoading(false);
-        }
-        return updated;
+      const res = await axios.get(`${API_URL}/batches/${batch_id}`);
+      const statuses: Record<string, string> = {};
+      res.data.jobs.forEach((j: JobStatus) => {
+        statuses[j.job_id] = j.status;
       });
-      if (res.data.status === "completed" || res.data.status === "failed") {
+      const finished = res.data.jobs.every(
+        (j: JobStatus) => j.status === "completed" || j.status === "failed"
+      );
+      setJobs((prev) => prev.map((j) => ({ ...j, status: statuses[j.job_id] ?? j.status })));
+      if (finished) {
+        setLoading(false);
         clearInterval(interval);
       }
     }, 2000);